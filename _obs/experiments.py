@@ -4,19 +4,22 @@
 
 # COMMAND ----------
 
-import openai 
 import tiktoken
 encoding = tiktoken.get_encoding("cl100k_base")
 from collections import Counter
 
+import httpx
+import openai
 import yaml
 with open('config.yml', 'r') as file:
     config = yaml.safe_load(file)
 
-openai.api_key = config['az_oai']['api']
-openai.api_base = f"https://{config['az_oai']['endpoint']}.openai.azure.com"
-openai.api_type = 'azure'
-openai.api_version = '2023-05-15' 
+# one explicit client with a keep-alive connection pool, shared by every call below
+client = openai.AzureOpenAI(
+    api_key=config['az_oai']['api'],
+    azure_endpoint=f"https://{config['az_oai']['endpoint']}.openai.azure.com",
+    api_version='2024-06-01',
+    http_client=httpx.Client(limits=httpx.Limits(max_connections=20, max_keepalive_connections=10), timeout=httpx.Timeout(60.0, connect=10.0)))
 
 deployment_name = config['az_oai']['deployment']
 
@@ -67,13 +70,13 @@ def num_tokens_from_messages(messages, model="gpt-4-turbo"):
 
 def generate_response(messages, deployment_name = deployment_name, temperature = 0.0):
 
-    completion = openai.ChatCompletion.create(
-        engine=deployment_name, 
+    completion = client.chat.completions.create(
+        model=deployment_name, 
         messages=messages, 
         temperature=temperature)
     
-    response = completion.choices[0]['message']['content']
-    usage = completion.usage.to_dict()
+    response = completion.choices[0].message.content
+    usage = completion.usage.model_dump()
     return response, usage
     
 prompt = 'Write a tagline for an ice cream shop.'
@@ -212,13 +215,13 @@ class Agent:
 
     def generate_response(self, messages: "list[dict]", deployment_name = deployment_name, temperature = 0.0):
 
-        completion = openai.ChatCompletion.create(
-            engine=deployment_name, 
+        completion = client.chat.completions.create(
+            model=deployment_name, 
             messages=messages, 
             temperature=temperature)
         
-        response = completion.choices[0]['message']['content']
-        usage = completion.usage.to_dict()
+        response = completion.choices[0].message.content
+        usage = completion.usage.model_dump()
         self.usages_raw.append(usage)
 
         return response
@@ -229,21 +232,23 @@ class Agent:
         output_tokens = 0
         final_answer = []
 
-        completion = openai.ChatCompletion.create(
-            engine=deployment_name, 
+        completion = client.chat.completions.create(
+            model=deployment_name, 
             messages=messages, 
             temperature=0.0,
             stream = True)
 
         for i in completion:
 
-            output = i['choices'][0]['delta']   
+            if not i.choices:
+                continue
+
+            token = i.choices[0].delta.content
 
-            if output not in [ {'role' : 'assistant'}, {}]:
+            if token:
 
                 output_tokens += 1
 
-                token = output['content']
                 print(f"{token}", end="")
 
                 final_answer.append(token)
@@ -0,0 +1,298 @@
+"""
+Command line entry point for batch debate runs.
+
+    python run.py tournament topics.jsonl --output results.jsonl --max-concurrency 8
+    python run.py tournament topics.jsonl --output results.jsonl --max-concurrency 8 --workers 4
+    python run.py tournament topics.jsonl --output results.jsonl --trace trace.json      (timeline for ui.perfetto.dev)
+    python run.py enqueue topics.jsonl --queue jobs.sqlite
+    python run.py worker --queue jobs.sqlite --max-concurrency 8      (on every node)
+    python run.py queue --queue jobs.sqlite --export results.jsonl
+    python run.py bench --baseline bench_baseline.json
+
+Each line of the topics file is a JSON object with `topic` and optionally `id`, `n_talking_points` and `n_rounds`.
+"""
+
+import argparse
+import functools
+import json
+
+def make_backend(args):
+
+    if not args.mock:
+        from utils.backends import AzureOpenAIBackend
+        return AzureOpenAIBackend(config_path = args.config, max_connections = args.max_connections, timeout = args.timeout)
+
+    from utils.backends import MockBackend
+    return MockBackend(latency = args.mock_latency, tokens_per_second = args.mock_tokens_per_second, error_rate = args.mock_error_rate)
+
+def add_backend_arguments(parser):
+
+    parser.add_argument('--config', default = None, help = 'Azure OpenAI config file (default: AZURE_OPENAI_* environment variables, $LLM_DEBATE_CONFIG or config.yml)')
+    parser.add_argument('--max-connections', type = int, default = 100, help = 'size of the shared keep-alive connection pool')
+    parser.add_argument('--timeout', type = float, default = 60.0, help = 'per request timeout in seconds')
+    parser.add_argument('--route', nargs = '*', default = [], help = 'deployment per role, phase or role:phase, e.g. debater=gpt-35-turbo final_verdict=gpt-4o')
+    parser.add_argument('--fallback', nargs = '*', default = [], help = 'deployment to cascade to when one keeps failing, e.g. gpt-35-turbo=gpt-4o')
+    parser.add_argument('--prices', default = None, help = 'JSON price table {deployment: {"input", "cached_input", "output"}} in € per 1000 tokens')
+    parser.add_argument('--mock', action = 'store_true', help = 'use the offline deterministic MockBackend instead of Azure')
+    parser.add_argument('--mock-latency', type = float, default = 0.0, help = 'mock time to first token in seconds')
+    parser.add_argument('--mock-tokens-per-second', type = float, default = None, help = 'mock streaming rate')
+    parser.add_argument('--mock-error-rate', type = float, default = 0.0, help = 'fraction of mock calls that fail')
+    parser.add_argument('--cache', default = None, help = 'SQLite file for caching temperature 0 responses across runs')
+    parser.add_argument('--cache-max-entries', type = int, default = 10000, help = 'least recently used responses beyond this are evicted')
+    parser.add_argument('--tokens-per-minute', type = int, default = None, help = "deployment's TPM quota, enables client-side rate limiting")
+    parser.add_argument('--requests-per-minute', type = int, default = 600, help = "deployment's RPM quota")
+    parser.add_argument('--rate-limit-file', default = None, help = 'share the rate limiter with other processes (e.g. --workers) through this file')
+    parser.add_argument('--verbose', action = 'store_true', help = 'print every finished turn to the console')
+    parser.add_argument('--events-file', default = None, help = 'JSONL file phase and turn events are appended to')
+    parser.add_argument('--events-include-tokens', action = 'store_true', help = 'also write every streamed token to the events file')
+
+def add_tournament_arguments(parser):
+
+    parser.add_argument('--max-concurrency', type = int, default = 4, help = 'maximum number of debates in flight')
+    parser.add_argument('--parallel-talking-points', action = 'store_true', help = 'run the talking points of each debate concurrently')
+    parser.add_argument('--early-stopping-threshold', type = float, default = None, help = 'end a talking point early once a round\'s n-gram novelty falls below this (0-1)')
+    parser.add_argument('--early-stopping-moderator-check', action = 'store_true', help = 'have the moderator confirm convergence before stopping')
+    parser.add_argument('--transcript-dir', default = None, help = 'stream each debate\'s turns to <id>.jsonl.gz in this directory')
+    parser.add_argument('--token-budget', type = int, default = None, help = 'hard limit on the tokens of each debate')
+    parser.add_argument('--cost-budget', type = float, default = None, help = 'hard limit on the € cost of each debate')
+    parser.add_argument('--run-token-budget', type = int, default = None, help = 'hard limit on the tokens of the whole run')
+    parser.add_argument('--run-cost-budget', type = float, default = None, help = 'hard limit on the € cost of the whole run')
+    parser.add_argument('--budget-mode', choices = ['cap', 'skip_rounds', 'verdict', 'abort'], default = 'skip_rounds',
+                        help = 'what gives when a call would exceed a budget: cap max_tokens, skip to the moderator, skip to the verdict or abort')
+    parser.add_argument('--batch', action = 'store_true', help = 'send setup, evaluation and verdict calls as batch jobs (local stand-in with --mock)')
+    parser.add_argument('--batch-phases', nargs = '+', default = None, help = 'phases whose calls are batched (default: setup, evaluations and verdict)')
+    parser.add_argument('--batch-dir', default = 'batches', help = 'directory for batch request and result JSONL files')
+    parser.add_argument('--batch-max-wait', type = float, default = 60.0, help = 'seconds requests are collected before a batch job is submitted')
+    parser.add_argument('--batch-poll-interval', type = float, default = 30.0, help = 'seconds between batch job status checks')
+    parser.add_argument('--batch-deployment', nargs = '*', default = [], help = 'batch deployment per deployment, e.g. gpt-4o=gpt-4o-batch')
+    parser.add_argument('--checkpoint-dir', default = None, help = 'checkpoint each debate to <id>.ckpt.json.gz here; existing checkpoints are resumed')
+    parser.add_argument('--trace', default = None, help = 'write a Chrome trace of every debate phase and agent call to this JSON file (open in ui.perfetto.dev)')
+
+def make_cache(args):
+
+    if not args.cache:
+        return None
+
+    from utils.cache import ResponseCache
+    return ResponseCache(args.cache, max_entries = args.cache_max_entries)
+
+def make_events(args):
+
+    from utils.events import EventBus, ConsolePrinter, JsonlFileSink
+
+    events = EventBus()
+    if args.verbose:
+        events.subscribe(ConsolePrinter(buffered = True))
+    if args.events_file:
+        events.subscribe(JsonlFileSink(args.events_file, include_tokens = args.events_include_tokens))
+    return events
+
+def make_rate_limiter(args):
+
+    if not args.tokens_per_minute:
+        return None
+
+    from utils.ratelimit import RateLimiter
+    return RateLimiter(tokens_per_minute = args.tokens_per_minute, requests_per_minute = args.requests_per_minute, path = args.rate_limit_file)
+
+def make_router(args):
+
+    if not args.route and not args.fallback:
+        return None
+
+    from utils.routing import Router, parse_routes
+    return Router(routes = parse_routes(args.route), fallbacks = parse_routes(args.fallback))
+
+def make_prices(args):
+
+    if not args.prices:
+        return None
+
+    with open(args.prices, 'r') as file:
+        return json.load(file)
+
+def make_early_stopping(args):
+
+    if args.early_stopping_threshold is None:
+        return None
+
+    from utils.convergence import EarlyStopping
+    return EarlyStopping(threshold = args.early_stopping_threshold, moderator_check = args.early_stopping_moderator_check)
+
+def make_run_budget(args, n_shards = 1):
+
+    if args.run_token_budget is None and args.run_cost_budget is None:
+        return None
+
+    # worker processes cannot share a Budget, each shard gets an even share of the run's
+    from utils.budget import Budget
+    return Budget(max_tokens = args.run_token_budget // n_shards if args.run_token_budget is not None else None,
+                  max_cost = args.run_cost_budget / n_shards if args.run_cost_budget is not None else None, name = 'run')
+
+def make_batch(args, backend):
+
+    if not args.batch:
+        return None
+
+    from utils.batch import BatchCollector, AzureBatchBackend, LocalBatchBackend, BATCH_PHASES
+    from utils.routing import parse_routes
+    batch_backend = LocalBatchBackend(backend) if args.mock else AzureBatchBackend(backend)
+    return BatchCollector(batch_backend, phases = args.batch_phases or BATCH_PHASES, directory = args.batch_dir, max_wait_s = args.batch_max_wait,
+                          poll_interval_s = args.batch_poll_interval, deployments = parse_routes(args.batch_deployment))
+
+def make_tracer(args):
+
+    if not args.trace:
+        return None
+
+    from utils.tracing import Tracer
+    return Tracer()
+
+def save_trace(args, tournament):
+    if args.trace:
+        tournament.debate_kwargs['tracer'].save(args.trace)
+
+def make_tournament(args, n_shards = 1):
+
+    from utils.tournament import Tournament
+
+    backend = make_backend(args)
+    tournament = Tournament(max_concurrency = args.max_concurrency,
+                            output_path = args.output,
+                            parallel_talking_points = args.parallel_talking_points,
+                            transcript_dir = args.transcript_dir,
+                            checkpoint_dir = args.checkpoint_dir,
+                            backend = backend,
+                            cache = make_cache(args),
+                            events = make_events(args),
+                            rate_limiter = make_rate_limiter(args),
+                            early_stopping = make_early_stopping(args),
+                            router = make_router(args),
+                            prices = make_prices(args),
+                            token_budget = args.token_budget,
+                            cost_budget = args.cost_budget,
+                            budget_mode = args.budget_mode,
+                            run_budget = make_run_budget(args, n_shards),
+                            batch = make_batch(args, backend),
+                            tracer = make_tracer(args))
+    return tournament
+
+def tournament(args):
+
+    if args.workers > 1:
+        from utils.sharding import run_sharded
+        report = run_sharded(functools.partial(make_tournament, args, args.workers), args.topics, n_shards = args.workers, output_path = args.output,
+                             shard_dir = args.shard_dir, trace_path = args.trace)
+    else:
+        from utils.tournament import read_topic_configs
+        runner = make_tournament(args)
+        report = runner.run(read_topic_configs(args.topics))
+        save_trace(args, runner)
+    print(json.dumps(report, indent = 2))
+
+def enqueue(args):
+
+    from utils.jobqueue import SQLiteJobQueue
+    from utils.tournament import read_topic_configs
+
+    n_enqueued = SQLiteJobQueue(args.queue, max_attempts = args.max_attempts).enqueue(read_topic_configs(args.topics))
+    print(json.dumps({'enqueued': n_enqueued}))
+
+def worker(args):
+
+    from utils.jobqueue import SQLiteJobQueue, QueueWorker
+
+    queue = SQLiteJobQueue(args.queue, max_attempts = args.max_attempts)
+    runner = make_tournament(args)
+    worker = QueueWorker(queue, runner, worker_id = args.worker_id, lease_s = args.lease, poll_interval_s = args.poll_interval, exit_when_empty = not args.forever)
+    report = worker.run()
+    save_trace(args, runner)
+    print(json.dumps(report, indent = 2))
+
+def queue(args):
+
+    from utils.jobqueue import SQLiteJobQueue
+
+    queue = SQLiteJobQueue(args.queue, max_attempts = args.max_attempts)
+    if args.export:
+        with open(args.export, 'w') as file:
+            for result in queue.results():
+                file.write(json.dumps(result) + '\n')
+    print(json.dumps(queue.stats(), indent = 2))
+
+def bench(args):
+
+    import sys
+    from utils.benchmark import run_benchmarks, compare_to_baseline, check_import_budget, save_baseline, load_baseline
+
+    results = run_benchmarks(rounds = args.rounds, talking_points = args.talking_points, response_tokens = args.response_tokens, repeats = args.repeats)
+    print(json.dumps(results, indent = 2))
+
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline)
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, load_baseline(args.baseline), tolerance = args.tolerance)
+        print(json.dumps({'regressions': regressions}, indent = 2))
+        if regressions:
+            sys.exit(1)
+
+    problems = check_import_budget(results['import'], budget = args.import_budget)
+    if problems:
+        print(json.dumps({'import_budget': problems}, indent = 2))
+        sys.exit(1)
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Run LLM agent debates in batch.')
+    subparsers = parser.add_subparsers(dest = 'command', required = True)
+
+    tournament_parser = subparsers.add_parser('tournament', help = 'run many topics concurrently on one event loop')
+    tournament_parser.add_argument('topics', help = 'JSONL file of topic configs')
+    tournament_parser.add_argument('--output', default = 'results.jsonl', help = 'JSONL file results are appended to as they complete')
+    tournament_parser.add_argument('--workers', type = int, default = 1, help = 'shard the topics across this many processes, each running max-concurrency debates')
+    tournament_parser.add_argument('--shard-dir', default = None, help = 'per-shard results, calls and reports (default: <output>.shards)')
+    add_tournament_arguments(tournament_parser)
+    add_backend_arguments(tournament_parser)
+    tournament_parser.set_defaults(func = tournament)
+
+    enqueue_parser = subparsers.add_parser('enqueue', help = 'add topics to a job queue for workers on any node')
+    enqueue_parser.add_argument('topics', help = 'JSONL file of topic configs; configs with an id are only ever enqueued once')
+    enqueue_parser.add_argument('--queue', default = 'jobs.sqlite', help = 'SQLite job queue file')
+    enqueue_parser.add_argument('--max-attempts', type = int, default = 3, help = 'deliveries of a job before it is failed for good')
+    enqueue_parser.set_defaults(func = enqueue)
+
+    worker_parser = subparsers.add_parser('worker', help = 'lease debate jobs from a job queue and run them until it is drained')
+    worker_parser.add_argument('--queue', default = 'jobs.sqlite', help = 'SQLite job queue file')
+    worker_parser.add_argument('--max-attempts', type = int, default = 3, help = 'deliveries of a job before it is failed for good')
+    worker_parser.add_argument('--output', default = None, help = 'also append this worker\'s results to a local JSONL file')
+    worker_parser.add_argument('--worker-id', default = None, help = 'default: host, pid and a random suffix')
+    worker_parser.add_argument('--lease', type = float, default = 120.0, help = 'seconds a job stays leased without a heartbeat before it is redelivered')
+    worker_parser.add_argument('--poll-interval', type = float, default = 5.0, help = 'seconds between lease attempts while the queue is empty')
+    worker_parser.add_argument('--forever', action = 'store_true', help = 'keep polling once the queue is drained')
+    add_tournament_arguments(worker_parser)
+    add_backend_arguments(worker_parser)
+    worker_parser.set_defaults(func = worker)
+
+    queue_parser = subparsers.add_parser('queue', help = 'job queue status')
+    queue_parser.add_argument('--queue', default = 'jobs.sqlite', help = 'SQLite job queue file')
+    queue_parser.add_argument('--max-attempts', type = int, default = 3)
+    queue_parser.add_argument('--export', default = None, help = 'write the results of finished jobs to this JSONL file')
+    queue_parser.set_defaults(func = queue)
+
+    bench_parser = subparsers.add_parser('bench', help = 'orchestration micro-benchmarks against a zero-latency mock backend')
+    bench_parser.add_argument('--rounds', type = int, nargs = '+', default = [1, 2, 4])
+    bench_parser.add_argument('--talking-points', type = int, nargs = '+', default = [1, 3, 5])
+    bench_parser.add_argument('--response-tokens', type = int, nargs = '+', default = [50, 200])
+    bench_parser.add_argument('--repeats', type = int, default = 3)
+    bench_parser.add_argument('--save-baseline', default = None, help = 'write the results to this JSON file')
+    bench_parser.add_argument('--baseline', default = None, help = 'compare against this JSON file and exit 1 on regressions')
+    bench_parser.add_argument('--tolerance', type = float, default = 0.2, help = 'relative slowdown allowed before flagging a regression')
+    bench_parser.add_argument('--import-budget', type = float, default = 0.25, help = 'seconds a cold import of utils.debate may take, exit 1 beyond it')
+    bench_parser.set_defaults(func = bench)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the utils package is imported from the app directory, as run.py and app.py do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,51 @@
+from utils.backends import MockBackend
+from utils.checkpoint import Checkpoint
+from utils.convergence import EarlyStopping
+from utils.debate import Debate
+
+def repeating_backend(answers = ('NEW', 'REPEATING')):
+    """Debaters always give the same answer; the moderator's convergence checks answer with `answers` in turn, the last one from then on."""
+
+    checks = []
+
+    def responder(messages):
+        if messages[-1]['content'].rstrip().endswith('NEW or REPEATING.'):
+            checks.append(messages)
+            return answers[min(len(checks), len(answers)) - 1]
+        return 'the same argument as before, nothing new'
+
+    return MockBackend(responder = responder), checks
+
+def run_debate(checkpoint = None, answers = ('NEW', 'REPEATING')):
+    backend, checks = repeating_backend(answers)
+    debate = Debate('Cats or dogs?', n_talking_points = 1, n_rounds = 6, backend = backend, verbose = False, checkpoint = checkpoint,
+                    early_stopping = EarlyStopping(threshold = 0.5, min_rounds = 2, moderator_check = True))
+    debate.debate()
+    return debate, checks
+
+def test_moderator_check_stops_talking_point():
+    debate, checks = run_debate()
+    assert len(checks) == 2
+    assert debate.early_stopping_report()['rounds_run'] == 3
+
+def test_moderator_check_negated_answer_does_not_stop():
+    # checked after every round but the last, and none of them ends the talking point
+    debate, checks = run_debate(answers = ('NOT REPEATING',))
+    assert len(checks) == 4
+    assert debate.early_stopping_report()['rounds_run'] == 6
+
+def test_moderator_check_with_checkpoint(tmp_path):
+    # every check has a turn key of its own, so later checks reach the backend instead of replaying the first one
+    debate, checks = run_debate(Checkpoint(str(tmp_path / 'debate.ckpt.json.gz')))
+    assert len(checks) == 2
+    assert debate.early_stopping_report()['rounds_run'] == 3
+
+def test_moderator_check_resumes_from_checkpoint(tmp_path):
+    path = str(tmp_path / 'debate.ckpt.json.gz')
+    run_debate(Checkpoint(path))
+
+    backend, checks = repeating_backend()
+    debate = Debate.resume(path, backend = backend, verbose = False, early_stopping = EarlyStopping(threshold = 0.5, min_rounds = 2, moderator_check = True))
+    debate.debate()
+    assert len(checks) == 0
+    assert debate.early_stopping_report()['rounds_run'] == 3
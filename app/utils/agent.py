@@ -1,103 +1,586 @@
-import openai 
+import asyncio
+import time
 from collections import Counter
-from utils.funcs import num_tokens_from_messages
+from utils.backends import Backend, BackendError, get_default_backend
+from utils.cache import ResponseCache, make_cache_key, replay_response
+from utils.events import EventBus, BudgetEvent, TokenEvent, TurnEndEvent, TurnStartEvent
+from utils.funcs import num_tokens_from_message, num_tokens_from_messages, num_tokens_from_text, REPLY_PRIMING_TOKENS, run_sync
+from utils.metrics import summarize_calls
+from utils.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+from utils.ratelimit import RateLimiter
+from utils.checkpoint import Checkpoint
+from utils.turns import MemoryEntry, Turn
+from utils.routing import Router
+from utils.budget import Budget
+from utils.batch import BatchCollector, BATCH_SUFFIX, BATCH_DISCOUNT, batch_deployment_name
+from utils.tracing import Tracer
 
-import yaml
-with open('../config.yml', 'r') as file:
-    config = yaml.safe_load(file)
-
-openai.api_key = config['az_oai']['api']
-openai.api_base = f"https://{config['az_oai']['endpoint']}.openai.azure.com"
-openai.api_type = 'azure'
-openai.api_version = '2023-05-15' 
-
-deployment_name = config['az_oai']['deployment']
+# call record fields kept as the attributes of its trace span
+TRACE_CALL_FIELDS = ['agent', 'role', 'phase', 'deployment', 'cached', 'prompt_tokens', 'completion_tokens', 'retries', 'backoff_s',
+                     'queue_s', 'ttft_s', 'latency_s', 'tokens_per_sec', 'fallback_from']
 
 class Agent:
 
-    def __init__(self, name: str) -> None:
+    def __init__(self, name: str, backend: Backend = None, cache: ResponseCache = None, token_model = 'gpt-4-turbo',
+                 compaction = None, n_pinned_messages = 1, events: EventBus = None, role = None,
+                 retry_policy: RetryPolicy = RetryPolicy(), circuit_breaker: CircuitBreaker = None, rate_limiter: RateLimiter = None,
+                 checkpoint: Checkpoint = None, router: Router = None, prices = None, budgets: "list[Budget]" = None,
+                 batch: BatchCollector = None, tracer: Tracer = None) -> None:
 
         self.name = name
-        self.messages = []
+        self.role = role or name
+        # utils.turns.MemoryEntry views (debate turns are shared with the transcript, not copied), see the messages property
+        self.memory = []
+        self._messages = None
         self.usages_raw = []
 
+        # one record per call with its phase and timings (queueing, time to first token, total latency, tokens/sec)
+        self.calls_raw = []
+
+        # token count of each entry of self.memory, kept in step with it so a turn only encodes what was appended
+        self.token_model = token_model
+        self.message_tokens = []
+
+        # optional utils.memory.CompactionStrategy; the first n_pinned_messages are never compacted
+        self.compaction = compaction
+        self.n_pinned_messages = n_pinned_messages
+        self.compacted_tokens = 0
+        self.tokens_saved = 0
+
+        # None means the process-wide Azure backend, resolved on the first call
+        self._backend = backend
+
+        # usages of responses served from the cache are kept apart, they were not paid for again
+        self.cache = cache
+        self.cache_usages_raw = []
+        self.cache_misses = 0
+
+        # streamed tokens and turn boundaries are emitted here, tagged with event_context (debate id, talking point)
+        self.events = events
+        self.event_context = {}
+        self.last_usage = None
+
+        # transient failures are retried with backoff; a circuit breaker shared per deployment sheds load while it fails
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+
+        # shared client-side quota for the deployment, see utils.ratelimit
+        self.rate_limiter = rate_limiter
+
+        # completed turns are recorded in the checkpoint and, when resuming, served from it; asks are counted per talking point
+        self.checkpoint = checkpoint
+        self.turn_counts = {}
+
+        # deployment per role and phase; usages are tagged with their deployment and priced with its entry in `prices`
+        # ({deployment: {'input', 'cached_input', 'output'}} in € per 1000 tokens), the costs below apply to any other
+        self.router = router
+        self.prices = prices or {}
+
+        # utils.budget.Budget objects (the debate's, the run's) every paid usage is charged to as it comes in
+        self.budgets = list(budgets or [])
+        # calls of the collector's phases go out as batch jobs rather than interactive requests, see utils.batch
+        self.batch = batch
+        # optional utils.tracing.Tracer every call is recorded in as a span, with its queueing, request and generation times
+        self.tracer = tracer
+
+        # local prompt token counts against the provider's, to calibrate projections (see projected_prompt_tokens)
+        self.projected_prompt_tokens_total = 0
+        self.reported_prompt_tokens_total = 0
+
         self.INPUT_COST = 0.01 / 1000
         self.OUTPUT_COST = 0.028 / 1000
+        # prompt tokens served from the provider's prompt cache are billed at a discount
+        self.CACHED_INPUT_COST = 0.005 / 1000
+
+    @property
+    def backend(self) -> Backend:
+        if self._backend is None:
+            self._backend = get_default_backend()
+        return self._backend
+
+    def generate_response(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+        return run_sync(self.generate_response_async(messages, deployment_name=deployment_name, temperature=temperature, max_tokens=max_tokens))
+    
+    def generate_response_with_streaming(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+        return run_sync(self.generate_response_with_streaming_async(messages, deployment_name=deployment_name, temperature=temperature, max_tokens=max_tokens))
+
+    def start_call(self, phase = None):
+        return {'agent': self.name, 'role': self.role, 'phase': phase, 'started_at': time.time(), 'requested': time.perf_counter(), 'retries': 0, 'backoff_s': 0.0}
+
+    def finish_call(self, call: dict, deployment_name, usage: dict, cached: bool):
+
+        end = time.perf_counter()
+        sent = call.pop('sent', call['requested'])
+        first_token = call.pop('first_token', end)
+        requested = call.pop('requested')
+
+        generation_s = end - first_token
+        call.update({'deployment': deployment_name or self.backend.deployment_name,
+                     'cached': cached,
+                     'queue_s': sent - requested,
+                     'ttft_s': first_token - sent,
+                     'latency_s': end - sent,
+                     'tokens_per_sec': usage['completion_tokens'] / generation_s if generation_s > 0 else None,
+                     'prompt_tokens': usage['prompt_tokens'],
+                     'completion_tokens': usage['completion_tokens']})
+        self.calls_raw.append(call)
+        self.calibrate(call)
+        if self.tracer is not None:
+            self.trace_call(call, requested, sent, first_token, end)
+
+    def trace_call(self, call: dict, requested: float, sent: float, first_token: float, end: float):
+
+        process = self.event_context.get('debate_id')
+        args = {key: call[key] for key in TRACE_CALL_FIELDS if call.get(key) is not None}
+        if 'talking_point' in self.event_context:
+            args['talking_point'] = self.event_context['talking_point']
+        self.tracer.complete(f"{self.name} {call['phase']}", requested, end, cat='agent', process=process, args=args)
+        # compaction and the rate limiter, the request until its first token (retries included), the answer streaming in
+        for name, start, stop in [('wait', requested, sent), ('request', sent, first_token), ('generate', first_token, end)]:
+            if stop > start:
+                self.tracer.complete(name, start, stop, cat='agent', process=process)
 
-    def generate_response(self, messages: "list[dict]", deployment_name = deployment_name, temperature = 0.0):
+    def expected_completion_tokens(self, default = 500):
+        # what this agent's answers have cost so far on average
+        completions = [call['completion_tokens'] for call in self.calls_raw if not call['cached']]
+        return int(sum(completions) / len(completions)) if completions else default
 
-        completion = openai.ChatCompletion.create(
-            engine=deployment_name, 
-            messages=messages, 
-            temperature=temperature)
-        
-        response = completion.choices[0]['message']['content']
-        usage = completion.usage.to_dict()
-        self.usages_raw.append(usage)
+    def projected_prompt_tokens(self):
+        # the next prompt by the local tokenizer, scaled by how far it has been off the provider's own counts so far
+        if not self.projected_prompt_tokens_total:
+            return self.prompt_tokens
+        return int(self.prompt_tokens * self.reported_prompt_tokens_total / self.projected_prompt_tokens_total)
+
+    def calibrate(self, call: dict):
+        if call.get('projected_prompt_tokens') and not call['cached']:
+            self.projected_prompt_tokens_total += call['projected_prompt_tokens']
+            self.reported_prompt_tokens_total += call['prompt_tokens']
+
+    def estimate_tokens(self, messages: "list[dict]"):
+        prompt_tokens = self.prompt_tokens if messages is self._messages else num_tokens_from_messages(messages, self.token_model)
+        return prompt_tokens + self.expected_completion_tokens(self.rate_limiter.expected_completion_tokens)
+
+    async def with_retries(self, call: dict, attempt, messages = None, replay = False):
+        """
+        Await attempt() -> (response, usage) under the rate limiter, retry policy and circuit breaker, recording retries and
+        backoff time on the call. Without `messages` (e.g. a batched call) the rate limiter is skipped; a `replay` (of a cached
+        answer) reaches no deployment, so it skips both the rate limiter and the circuit breaker.
+        """
+
+        breaker = self.circuit_breaker if not replay else None
+        n_retries = 0
+        while True:
+            reservation = None
+            trial = False
+            try:
+                if self.rate_limiter is not None and messages is not None and not replay:
+                    reservation = await self.rate_limiter.acquire(self.estimate_tokens(messages), key=self.event_context.get('debate_id'))
+                if breaker is not None:
+                    trial = breaker.before_call()
+                # latency and time to first token are measured from the first attempt, retries included
+                call.setdefault('sent', time.perf_counter())
+                result = await attempt()
+
+            except Exception as e:
+                if reservation is not None:
+                    self.rate_limiter.reconcile(reservation, 0)
+                if breaker is not None and not isinstance(e, CircuitOpenError):
+                    breaker.record_failure()
+                if self.retry_policy is None or not self.retry_policy.should_retry(e, n_retries):
+                    raise
+
+                delay = self.retry_policy.delay(n_retries, e)
+                n_retries += 1
+                call['retries'] += 1
+                call['backoff_s'] += delay
+                await asyncio.sleep(delay)
+                continue
+
+            except BaseException:
+                # cancelled (e.g. a debate dropped with its lost lease): says nothing about the deployment, but must not keep
+                # the breaker's trial slot or the reserved tokens
+                if reservation is not None:
+                    self.rate_limiter.reconcile(reservation, 0)
+                if trial:
+                    breaker.release_trial()
+                raise
+
+            if reservation is not None:
+                self.rate_limiter.reconcile(reservation, result[1]['total_tokens'])
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+    def cache_key(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+        # only deterministic calls are worth caching, and an answer cut short by a budget is not the answer
+        if self.cache is None or temperature != 0.0 or max_tokens is not None:
+            return None
+        return make_cache_key(deployment_name or self.backend.deployment_name, temperature, messages)
+
+    async def generate_response_async(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, call = None, max_tokens = None, batched = False):
+
+        call = call or self.start_call()
+
+        cache_key = self.cache_key(messages, deployment_name, temperature, max_tokens)
+        cached = self.cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            response, usage = cached
+            self.record_usage(usage, deployment_name, cached=True)
+            self.last_usage = usage
+            self.finish_call(call, deployment_name, usage, cached=True)
+            return response
+
+        if batched:
+            # bulk capacity has its own quota, so batched calls bypass the interactive rate limiter
+            deployment_name = deployment_name or self.backend.deployment_name
+            response, usage = await self.with_retries(call, lambda: self.batch.chat(messages, deployment_name, temperature=temperature, max_tokens=max_tokens))
+            deployment_name = batch_deployment_name(deployment_name)
+        else:
+            response, usage = await self.with_retries(call, lambda: self.backend.chat(messages, deployment_name=deployment_name, temperature=temperature, max_tokens=max_tokens), messages=messages)
+        self.record_usage(usage, deployment_name)
+        self.last_usage = usage
+        self.finish_call(call, deployment_name, usage, cached=False)
+
+        if cache_key:
+            self.cache_misses += 1
+            self.cache.put(cache_key, response, usage)
 
         return response
-    
-    def generate_response_with_streaming(self, messages: "list[dict]", deployment_name = deployment_name, temperature = 0.0):
 
-        input_tokens = num_tokens_from_messages(messages)
-        output_tokens = 0
-        final_answer = []
+    async def generate_response_with_streaming_async(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, call = None, max_tokens = None):
+
+        call = call or self.start_call()
 
-        completion = openai.ChatCompletion.create(
-            engine=deployment_name, 
-            messages=messages, 
-            temperature=0.0,
-            stream = True)
+        cache_key = self.cache_key(messages, deployment_name, temperature, max_tokens)
+        cached = self.cache.get(cache_key) if cache_key else None
 
-        for i in completion:
+        # characters already handed to event consumers; a retried stream only emits what goes beyond them, so an
+        # interrupted answer resumes where it stopped instead of being repeated (exact for deterministic calls)
+        emitted = {'length': 0}
 
-            output = i['choices'][0]['delta']   
+        async def attempt():
 
-            if output not in [ {'role' : 'assistant'}, {}]:
+            final_answer = []
+            usage = None
+            length = 0
 
-                output_tokens += 1
+            if cached is not None:
+                # replay the cached answer through the same streaming path
+                chunks = replay_response(*cached)
+            else:
+                chunks = self.backend.chat_stream(messages, deployment_name=deployment_name, temperature=temperature, max_tokens=max_tokens)
 
-                token = output['content']
-                print(f"{token}", end="")
+            async for chunk in chunks:
 
+                if 'usage' in chunk:
+                    usage = chunk['usage']
+                    continue
+
+                if 'first_token' not in call:
+                    call['first_token'] = time.perf_counter()
+
+                token = chunk['content']
                 final_answer.append(token)
+                length += len(token)
 
-            else:
-                continue
+                if length > emitted['length']:
+                    new = token[max(0, len(token) - (length - emitted['length'])):]
+                    emitted['length'] = length
+                    if self.events is not None:
+                        self.events.emit(TokenEvent(agent=self.name, token=new, **self.event_context))
+
+            response = ''.join(final_answer)
 
-        usage = {'prompt_tokens': input_tokens, 'completion_tokens': output_tokens, 'total_tokens': output_tokens + input_tokens}
-        self.usages_raw.append(usage)
+            # not every provider reports usage on streamed calls; chunks are not tokens, so count the answer itself
+            if usage is None:
+                input_tokens = self.prompt_tokens if messages is self._messages else num_tokens_from_messages(messages, self.token_model)
+                output_tokens = num_tokens_from_text(response, self.token_model)
+                usage = {'prompt_tokens': input_tokens, 'completion_tokens': output_tokens, 'total_tokens': output_tokens + input_tokens, 'cached_prompt_tokens': 0}
+
+            return response, usage
+
+        final_answer_print, usage = await self.with_retries(call, attempt, messages=messages, replay=cached is not None)
+
+        self.last_usage = usage
+        self.finish_call(call, deployment_name, usage, cached=cached is not None)
+
+        self.record_usage(usage, deployment_name, cached=cached is not None)
+        if cached is None:
+            if cache_key:
+                self.cache_misses += 1
+                self.cache.put(cache_key, final_answer_print, usage)
 
-        final_answer_print = ''.join(final_answer)
         return final_answer_print
 
     def set_system_prompt(self, system_prompt: str):
-        self.messages.append({"role": "system", "content": system_prompt})
+        self.add_message_to_memory(role="system", message=system_prompt)
 
-    def add_message_to_memory(self, role:str, message: str):
-        self.messages.append({"role": role, "content": message})
+    def add_message_to_memory(self, role:str, message, prefix = '', suffix = ''):
+        # a Turn is referenced rather than copied, its prefix and suffix are only joined to it when the memory is materialized
+        if isinstance(message, Turn):
+            entry = MemoryEntry(role, turn=message, prefix=prefix, suffix=suffix)
+        else:
+            entry = MemoryEntry(role, text=prefix + message + suffix)
+        self.memory.append(entry)
+        self._messages = None
+        self.message_tokens.append(num_tokens_from_message(entry.to_message(), self.token_model))
         #print(f"----- {self.name} -----\n{memory}\n")
 
-    def ask(self):
-        #return self.generate_response(self.messages)
-        return self.generate_response_with_streaming(self.messages)
-    
+    @property
+    def messages(self):
+        """The memory as message dicts, materialized on first access and dropped again once the ask it was built for is done."""
+        if self._messages is None:
+            self._messages = [entry.to_message() for entry in self.memory]
+        return self._messages
+
+    @messages.setter
+    def messages(self, messages: "list[dict]"):
+        self.memory = [MemoryEntry(message['role'], text=message['content']) for message in messages]
+        self._messages = None
+        self.message_tokens = [num_tokens_from_message(entry.to_message(), self.token_model) for entry in self.memory]
+
+    @property
+    def prompt_tokens(self):
+        """Size of the prompt the next ask() would send."""
+        return sum(self.message_tokens) + REPLY_PRIMING_TOKENS
+
+    def ask(self, phase = None, max_tokens = None):
+        return run_sync(self.ask_async(phase=phase, max_tokens=max_tokens))
+
+    async def ask_async(self, phase = None, max_tokens = None):
+
+        turn_key = self.next_turn_key()
+        if self.checkpoint is not None and turn_key in self.checkpoint:
+            return self.replay_turn(self.checkpoint.get(turn_key))
+        marks = self.usage_marks()
+
+        # queueing time runs from here until the request is actually sent
+        call = self.start_call(phase)
+
+        memory = None
+        if self.compaction is not None:
+            compacted_tokens = await self.compaction.compact(self)
+            self.compacted_tokens += compacted_tokens
+            self.tokens_saved += self.compacted_tokens
+            if compacted_tokens:
+                memory = {'messages': list(self.messages)}
+
+        if self.events is not None:
+            self.events.emit(TurnStartEvent(agent=self.name, **self.event_context))
+
+        deployment_name = self.deployment_for(phase)
+        call['projected_prompt_tokens'] = self.prompt_tokens
+
+        #response = await self.generate_response_async(self.messages)
+        try:
+            if self.batch is not None and phase in self.batch.phases:
+                response = await self.generate_response_async(self.messages, deployment_name=deployment_name, call=call, max_tokens=max_tokens, batched=True)
+                # nothing was streamed, hand the whole answer to token consumers at once
+                if self.events is not None:
+                    self.events.emit(TokenEvent(agent=self.name, token=response, **self.event_context))
+            else:
+                response = await self.generate_response_with_streaming_async(self.messages, deployment_name=deployment_name, call=call, max_tokens=max_tokens)
+        except BackendError:
+            # cascade to the fallback deployment (interactively) once the routed one has exhausted its retries
+            fallback = self.router.fallback(deployment_name or self.backend.deployment_name) if self.router is not None else None
+            if fallback is None:
+                raise
+            call['fallback_from'] = deployment_name or self.backend.deployment_name
+            response = await self.generate_response_with_streaming_async(self.messages, deployment_name=fallback, call=call, max_tokens=max_tokens)
+        self._messages = None
+
+        if self.checkpoint is not None:
+            self.checkpoint.record(turn_key, self.turn_record(response, marks, memory))
+
+        if self.events is not None:
+            self.events.emit(TurnEndEvent(agent=self.name, response=response, usage=self.last_usage, **self.event_context))
+        return response
+
+    def deployment_for(self, phase = None):
+        return self.router.deployment(self.role, phase) if self.router is not None else None
+
+    def record_usage(self, usage: dict, deployment_name = None, cached = False):
+        # usages are priced by the deployment that served them; cache hits were not paid for again and are kept apart
+        usage = {**usage, 'deployment': deployment_name or self.backend.deployment_name}
+        if cached:
+            self.cache_usages_raw.append(usage)
+        else:
+            self.usages_raw.append(usage)
+            self.charge_budgets([usage])
+
+    def charge_budgets(self, usages: "list[dict]"):
+        for budget in self.budgets:
+            for usage in usages:
+                budget.charge(usage['total_tokens'], self.usage_cost(usage))
+            if self.events is not None:
+                self.events.emit(BudgetEvent(agent=self.name, budget=budget.name, spent_tokens=budget.spent_tokens, spent_cost=budget.spent_cost,
+                                             max_tokens=budget.max_tokens, max_cost=budget.max_cost, **self.event_context))
+
+    def next_turn_key(self):
+        # stable across runs and independent of whether talking points run in parallel
+        talking_point = self.event_context.get('talking_point')
+        n = self.turn_counts.get(talking_point, 0)
+        self.turn_counts[talking_point] = n + 1
+        return f'{self.name}|{talking_point}|{n}'
+
+    def usage_marks(self):
+        return len(self.usages_raw), len(self.cache_usages_raw), len(self.calls_raw), self.cache_misses, self.tokens_saved
+
+    def turn_record(self, response: str, marks, memory = None):
+        """Everything a turn changed apart from the caller's own memory updates; memory is only kept when compaction rewrote it."""
+
+        n_usages, n_cache_usages, n_calls, cache_misses, tokens_saved = marks
+        record = {'response': response,
+                  'usages': self.usages_raw[n_usages:],
+                  'cache_usages': self.cache_usages_raw[n_cache_usages:],
+                  'calls': self.calls_raw[n_calls:],
+                  'cache_misses': self.cache_misses - cache_misses,
+                  'tokens_saved': self.tokens_saved - tokens_saved,
+                  'compacted_tokens': self.compacted_tokens,
+                  'last_usage': self.last_usage}
+        if memory is not None:
+            record['memory'] = memory
+        return record
+
+    def replay_turn(self, record: dict):
+        # a turn completed before the checkpoint: no backend call and no events, just its effects on memory and usage
+        if 'memory' in record:
+            self.messages = list(record['memory']['messages'])
+        self.usages_raw.extend(record['usages'])
+        self.charge_budgets(record['usages'])
+        self.cache_usages_raw.extend(record['cache_usages'])
+        self.calls_raw.extend(record['calls'])
+        for call in record['calls']:
+            self.calibrate(call)
+        self.cache_misses += record['cache_misses']
+        self.tokens_saved += record['tokens_saved']
+        self.compacted_tokens = record['compacted_tokens']
+        self.last_usage = record['last_usage']
+        if self.tracer is not None:
+            self.tracer.instant(f'{self.name} replayed', cat='agent', process=self.event_context.get('debate_id'), n_calls=len(record['calls']))
+        return record['response']
+
+    def replace_messages(self, start: int, stop: int, messages: "list[dict]"):
+        self.memory[start:stop] = [MemoryEntry(message['role'], text=message['content']) for message in messages]
+        self._messages = None
+        self.message_tokens[start:stop] = [num_tokens_from_message(message, self.token_model) for message in messages]
+
+    def truncate_memory(self, n_messages: int):
+        del self.memory[n_messages:]
+        self._messages = None
+        del self.message_tokens[n_messages:]
+        # compaction only ever touches messages past the pinned ones, so whatever it removed is gone now
+        if n_messages <= self.n_pinned_messages:
+            self.compacted_tokens = 0
+
     def empty_memory_for_next_talking_point(self):
-        self.messages = self.messages[:1]
+        self.truncate_memory(1)
 
     def empty_memory_for_moderator_for_next_talking_point_summary(self):
-        self.messages = self.messages[:3]
+        self.truncate_memory(3)
     
+    def fork(self):
+        # copy of the agent's memory with its own usage records, so it can run concurrently with the original
+        agent = Agent(self.name, backend=self._backend, cache=self.cache, token_model=self.token_model,
+                      compaction=self.compaction, n_pinned_messages=self.n_pinned_messages, events=self.events, role=self.role,
+                      retry_policy=self.retry_policy, circuit_breaker=self.circuit_breaker, rate_limiter=self.rate_limiter,
+                      checkpoint=self.checkpoint, router=self.router, prices=self.prices, budgets=self.budgets,
+                      batch=self.batch, tracer=self.tracer)
+        agent.event_context = dict(self.event_context)
+        agent.turn_counts = dict(self.turn_counts)
+        agent.compacted_tokens = self.compacted_tokens
+        agent.projected_prompt_tokens_total = self.projected_prompt_tokens_total
+        agent.reported_prompt_tokens_total = self.reported_prompt_tokens_total
+        agent.memory = list(self.memory)
+        agent.message_tokens = list(self.message_tokens)
+        return agent
+
+    def merge_usage(self, other: "Agent"):
+        self.usages_raw.extend(other.usages_raw)
+        self.calls_raw.extend(other.calls_raw)
+        self.cache_usages_raw.extend(other.cache_usages_raw)
+        self.cache_misses += other.cache_misses
+        self.tokens_saved += other.tokens_saved
+
+    def get_latency_summary(self, by = 'phase'):
+        return summarize_calls(self.calls_raw, by=by)
+
     def get_token_usage(self):
-        c = Counter()
-        for d in self.usages_raw:
-            c.update(d)
-        return dict(c)
+        token_usage = dict(sum_usages(self.usages_raw))
+
+        if any(call['retries'] for call in self.calls_raw):
+            token_usage['retries'] = sum(call['retries'] for call in self.calls_raw)
+            token_usage['retry_backoff_s'] = sum(call['backoff_s'] for call in self.calls_raw)
+
+        if self.cache is not None:
+            cached = sum_usages(self.cache_usages_raw)
+            token_usage['cache_hits'] = len(self.cache_usages_raw)
+            token_usage['cache_misses'] = self.cache_misses
+            token_usage['cached_response_prompt_tokens'] = cached.get('prompt_tokens', 0)
+            token_usage['cached_response_completion_tokens'] = cached.get('completion_tokens', 0)
+
+        return token_usage
     
+    def get_prompt_cache_usage(self):
+        token_usage = self.get_token_usage()
+        prompt_tokens = token_usage.get('prompt_tokens', 0)
+        cached_prompt_tokens = token_usage.get('cached_prompt_tokens', 0)
+        return {'prompt_tokens': prompt_tokens, 'cached_prompt_tokens': cached_prompt_tokens,
+                'hit_ratio': cached_prompt_tokens / prompt_tokens if prompt_tokens else 0.0}
+
+    def price(self, deployment_name):
+        """(input, cached input, output) € per token for a deployment."""
+        if deployment_name is not None and deployment_name.endswith(BATCH_SUFFIX):
+            deployment_name = deployment_name[:-len(BATCH_SUFFIX)]
+            discount = self.prices.get(deployment_name, {}).get('batch_discount', BATCH_DISCOUNT)
+            return tuple(price * discount for price in self.price(deployment_name))
+        if deployment_name in self.prices:
+            price = self.prices[deployment_name]
+            return price['input'] / 1000, price.get('cached_input', price['input']) / 1000, price['output'] / 1000
+        return self.INPUT_COST, self.CACHED_INPUT_COST, self.OUTPUT_COST
+
+    def usage_cost(self, usage: dict):
+        input_price, cached_input_price, output_price = self.price(usage.get('deployment'))
+        cached_prompt_tokens = usage.get('cached_prompt_tokens', 0)
+        return (usage['prompt_tokens'] - cached_prompt_tokens) * input_price + cached_prompt_tokens * cached_input_price + usage['completion_tokens'] * output_price
+
+    def get_cost_by_deployment(self):
+
+        costs = {}
+        for deployment_name, usage in group_usages(self.usages_raw).items():
+            input_price, cached_input_price, output_price = self.price(deployment_name)
+            cached_prompt_tokens = usage.get('cached_prompt_tokens', 0)
+            cached_input_cost = cached_prompt_tokens * cached_input_price
+            input_cost = (usage.get('prompt_tokens', 0) - cached_prompt_tokens) * input_price + cached_input_cost
+            output_cost = usage.get('completion_tokens', 0) * output_price
+            costs[deployment_name] = {'input_cost_€': input_cost, 'cached_input_cost_€': cached_input_cost, 'output_cost_€': output_cost, 'total_cost_€': output_cost + input_cost}
+        return costs
+
     def get_cost_usage(self):
 
-        token_usage = self.get_token_usage()
-        input_cost = token_usage['prompt_tokens'] * self.INPUT_COST
-        output_cost = token_usage['completion_tokens'] * self.OUTPUT_COST
+        c = Counter({'input_cost_€': 0.0, 'cached_input_cost_€': 0.0, 'output_cost_€': 0.0, 'total_cost_€': 0.0})
+        for cost in self.get_cost_by_deployment().values():
+            c.update(cost)
+        cost_usage = dict(c)
+
+        if self.cache is not None:
+            # what the cache hits would have cost, not part of the total
+            cost_usage['cache_saved_cost_€'] = 0.0
+            for deployment_name, usage in group_usages(self.cache_usages_raw).items():
+                input_price, _, output_price = self.price(deployment_name)
+                cost_usage['cache_saved_cost_€'] += usage.get('prompt_tokens', 0) * input_price + usage.get('completion_tokens', 0) * output_price
+
+        return cost_usage
+
+def sum_usages(usages: "list[dict]"):
+    # only the numeric fields add up, the deployment tag does not
+    c = Counter()
+    for usage in usages:
+        c.update({key: value for key, value in usage.items() if key != 'deployment'})
+    return c
 
-        return {'input_cost_€': input_cost, 'output_cost_€': output_cost, 'total_cost_€': output_cost + input_cost}
\ No newline at end of file
+def group_usages(usages: "list[dict]"):
+    groups = {}
+    for usage in usages:
+        groups.setdefault(usage.get('deployment'), []).append(usage)
+    return {deployment_name: sum_usages(group) for deployment_name, group in groups.items()}
@@ -0,0 +1,284 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+
+from utils.funcs import approx_num_tokens
+
+class BackendError(Exception):
+    """Raised by a backend when a chat call fails; carries the HTTP status and Retry-After hint when known."""
+
+    def __init__(self, message: str, status_code = None, retry_after = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+def normalize_usage(usage: dict):
+    """Flatten a provider usage payload into the numeric dict Agent sums up, including provider prompt-cache hits."""
+    details = usage.get('prompt_tokens_details') or {}
+    return {'prompt_tokens': usage.get('prompt_tokens', 0),
+            'completion_tokens': usage.get('completion_tokens', 0),
+            'total_tokens': usage.get('total_tokens', 0),
+            'cached_prompt_tokens': details.get('cached_tokens') or 0}
+
+def provider_usage(usage: dict):
+    """The other way round: a normalized usage dict in the provider's shape, which reports prompt cache hits under prompt_tokens_details."""
+    return {'prompt_tokens': usage['prompt_tokens'], 'completion_tokens': usage['completion_tokens'], 'total_tokens': usage['total_tokens'],
+            'prompt_tokens_details': {'cached_tokens': usage.get('cached_prompt_tokens', 0)}}
+
+class Backend:
+    """
+    Interface between Agent and an LLM provider.
+
+    chat() returns the full response together with its usage dict ({'prompt_tokens', 'completion_tokens', 'total_tokens', 'cached_prompt_tokens'}).
+    chat_stream() is an async generator of chunks: {'content': str} for every token and, if the provider reports it, a final {'usage': dict}.
+    `max_tokens` caps the completion (None: the deployment's own limit).
+    """
+
+    deployment_name = None
+
+    async def chat(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+        raise NotImplementedError
+
+    async def chat_stream(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+        raise NotImplementedError
+        yield
+
+class AzureOpenAIBackend(Backend):
+    """
+    Azure OpenAI chat completions through an explicit utils.client.AzureOpenAIClient.
+
+    Without a client one is built on first use from `config` / `config_path` (see utils.config.load_config) and
+    `client_options`, so creating the backend neither reads configuration nor imports openai.
+    Share the backend (or at least its client) between debates so they share one pool of keep-alive connections.
+    Set `stream_usage` on API versions that report usage on streamed calls (2024-09-01-preview and later).
+    """
+
+    def __init__(self, client = None, config = None, config_path = None, stream_usage = False, **client_options) -> None:
+
+        self._client = client
+        self.config = config
+        self.config_path = config_path
+        self.client_options = client_options
+        self.stream_usage = stream_usage
+
+    @property
+    def client(self):
+        if self._client is None:
+            from utils.client import AzureOpenAIClient
+            self._client = AzureOpenAIClient.from_config(self.config_path, self.config, **self.client_options)
+        return self._client
+
+    @property
+    def deployment_name(self):
+        return self.client.deployment_name
+
+    def to_backend_error(self, error: Exception):
+        # surface the HTTP status and Retry-After of openai errors so the retry policy can act on them; connection errors carry no status
+        response = getattr(error, 'response', None)
+        headers = response.headers if response is not None else {}
+        retry_after = headers.get('retry-after')
+        return BackendError(str(error), status_code = getattr(error, 'status_code', None), retry_after = float(retry_after) if retry_after else None)
+
+    async def chat(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+
+        import openai
+
+        options = {'max_tokens': max_tokens} if max_tokens is not None else {}
+
+        try:
+            completion = await self.client.async_client.chat.completions.create(
+                model=deployment_name or self.deployment_name,
+                messages=messages,
+                temperature=temperature,
+                **options)
+        except openai.OpenAIError as e:
+            raise self.to_backend_error(e) from e
+
+        response = completion.choices[0].message.content
+        usage = normalize_usage(completion.usage.model_dump())
+        return response, usage
+
+    async def chat_stream(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+
+        import openai
+
+        options = {'stream_options': {'include_usage': True}} if self.stream_usage else {}
+        if max_tokens is not None:
+            options['max_tokens'] = max_tokens
+
+        try:
+            completion = await self.client.async_client.chat.completions.create(
+                model=deployment_name or self.deployment_name,
+                messages=messages,
+                temperature=temperature,
+                stream = True,
+                **options)
+            try:
+                async for i in completion:
+                    for chunk in self.stream_chunks(i):
+                        yield chunk
+            finally:
+                # hand the connection back to the pool even if the consumer stops early
+                await completion.close()
+        except openai.OpenAIError as e:
+            raise self.to_backend_error(e) from e
+
+    def stream_chunks(self, i):
+
+        # only newer API versions report usage (and prompt cache hits) on streamed calls, in a final chunk without choices
+        if i.usage:
+            yield {'usage': normalize_usage(i.usage.model_dump())}
+
+        if not i.choices:
+            return
+
+        content = i.choices[0].delta.content
+
+        if content:
+            yield {'content': content}
+
+_default_backend = None
+
+def get_default_backend():
+    """The process-wide Azure backend, created on first use; its configuration is only resolved on the first call."""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = AzureOpenAIBackend()
+    return _default_backend
+
+### MOCK ###
+
+MOCK_VOCABULARY = ['debate', 'argument', 'evidence', 'however', 'therefore', 'data', 'graph', 'vector', 'retrieval', 'latency',
+                   'cost', 'scalable', 'simple', 'complex', 'users', 'quality', 'consider', 'because', 'indeed', 'opponent',
+                   'the', 'a', 'of', 'and', 'is', 'to', 'in', 'that', 'we', 'it']
+
+class MockBackend(Backend):
+    """
+    Offline, deterministic stand-in for an LLM deployment.
+
+    The same messages always produce the same response. `latency` is the time to first token in seconds, `tokens_per_second`
+    throttles streaming (None streams as fast as possible) and a fraction `error_rate` of calls fail with `error_status_code`;
+    a fraction `stream_interrupt_rate` of streams break off half way through with a connection error.
+    A `responder(messages) -> str` can replace the generated text entirely.
+
+    With `prompt_caching` the mock mimics provider prefix caching: a prompt prefix of at least `PROMPT_CACHE_MIN_TOKENS`
+    seen on an earlier call is reported as cached, in blocks of `PROMPT_CACHE_BLOCK_TOKENS`.
+    """
+
+    PROMPT_CACHE_MIN_TOKENS = 1024
+    PROMPT_CACHE_BLOCK_TOKENS = 128
+
+    def __init__(self, latency = 0.0, tokens_per_second = None, response_tokens = 64, error_rate = 0.0, error_status_code = 429,
+                 retry_after = 1.0, seed = 0, responder = None, deployment_name = 'mock', prompt_caching = True, stream_interrupt_rate = 0.0) -> None:
+
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self.stream_interrupt_rate = stream_interrupt_rate
+        self.error_status_code = error_status_code
+        self.retry_after = retry_after
+        self.seed = seed
+        self.responder = responder
+        self.deployment_name = deployment_name
+
+        self.prompt_caching = prompt_caching
+        self.prompt_prefixes = set()
+
+        self.n_calls = 0
+        self.n_errors = 0
+
+    def maybe_fail(self):
+
+        self.n_calls += 1
+        if self.error_rate and random.Random(f'{self.seed}-error-{self.n_calls}').random() < self.error_rate:
+            self.n_errors += 1
+            raise BackendError(f'Injected mock error on call {self.n_calls}', status_code = self.error_status_code, retry_after = self.retry_after)
+
+    def complete(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+        """Return the response split into token chunks and the usage dict for `messages`."""
+
+        if self.responder is not None:
+            response = self.responder(messages)
+            chunks = re.findall(r'\s*\S+', response)
+        else:
+            key = hashlib.sha256(json.dumps([self.seed, deployment_name or self.deployment_name, temperature, messages], sort_keys = True).encode()).hexdigest()
+            rng = random.Random(key)
+            chunks = self.talking_points(messages, rng)
+
+            if chunks is None:
+                chunks = [(' ' if i else '') + rng.choice(MOCK_VOCABULARY) for i in range(self.response_tokens)]
+
+        if max_tokens is not None:
+            chunks = chunks[:max_tokens]
+
+        prompt_tokens = sum(approx_num_tokens(message['content']) + 3 for message in messages) + 3
+        cached_prompt_tokens = min(prompt_tokens, self.cached_prompt_tokens(deployment_name or self.deployment_name, messages))
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': len(chunks), 'total_tokens': prompt_tokens + len(chunks),
+                 'cached_prompt_tokens': cached_prompt_tokens}
+        return chunks, usage
+
+    def cached_prompt_tokens(self, deployment_name: str, messages: "list[dict]"):
+
+        if not self.prompt_caching:
+            return 0
+
+        prompt = deployment_name + '\n' + ''.join(f"<|{message['role']}|>{message['content']}" for message in messages)
+        block = self.PROMPT_CACHE_BLOCK_TOKENS * 4
+
+        cached = 0
+        prefix_hash = hashlib.sha256()
+        for end in range(block, len(prompt) + 1, block):
+            prefix_hash.update(prompt[end - block:end].encode())
+            prefix = prefix_hash.hexdigest()
+            if prefix in self.prompt_prefixes:
+                cached = end
+            else:
+                self.prompt_prefixes.add(prefix)
+
+        cached_tokens = cached // 4
+        return cached_tokens if cached_tokens >= self.PROMPT_CACHE_MIN_TOKENS else 0
+
+    def talking_points(self, messages: "list[dict]", rng: random.Random):
+        # the moderator's agenda has to be a semicolon separated list for Debate to parse it
+        match = re.search(r'come up with exactly (\d+) talking points', messages[-1]['content'])
+        if match is None:
+            return None
+
+        points = ['Aspect ' + ' '.join(rng.choice(MOCK_VOCABULARY) for _ in range(3)) for _ in range(int(match.group(1)))]
+        return re.findall(r'\s*\S+', '; '.join(points))
+
+    async def chat(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+
+        self.maybe_fail()
+        chunks, usage = self.complete(messages, deployment_name, temperature, max_tokens)
+
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += len(chunks) / self.tokens_per_second
+        if delay:
+            await asyncio.sleep(delay)
+
+        return ''.join(chunks), usage
+
+    async def chat_stream(self, messages: "list[dict]", deployment_name = None, temperature = 0.0, max_tokens = None):
+
+        self.maybe_fail()
+        chunks, usage = self.complete(messages, deployment_name, temperature, max_tokens)
+
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        interrupt = self.stream_interrupt_rate and random.Random(f'{self.seed}-interrupt-{self.n_calls}').random() < self.stream_interrupt_rate
+
+        for n, chunk in enumerate(chunks):
+            if interrupt and n == len(chunks) // 2:
+                self.n_errors += 1
+                raise BackendError(f'Injected stream interruption on call {self.n_calls}')
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            yield {'content': chunk}
+
+        yield {'usage': usage}
@@ -0,0 +1,273 @@
+import asyncio
+import json
+import os
+import uuid
+
+from utils.backends import BackendError, normalize_usage, provider_usage
+
+# phases that are not latency sensitive: the Master's setup and the moderator's judgements
+BATCH_PHASES = ('master_setup', 'talking_points', 'moderator_eval', 'final_verdict')
+
+# usages of batched calls are tagged with '<deployment>@batch' and priced at the deployment's price times its 'batch_discount'
+BATCH_SUFFIX = '@batch'
+BATCH_DISCOUNT = 0.5
+
+FINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+def batch_deployment_name(deployment_name: str):
+    return deployment_name + BATCH_SUFFIX
+
+class BatchBackend:
+    """
+    Interface to a provider's batch API.
+
+    submit() uploads a JSONL file of chat completion requests (one {'custom_id', 'method', 'url', 'body'} per line) and returns a batch id,
+    status() reports the batch's status ('completed', 'failed', 'expired', 'cancelled' are final) and results() writes the
+    batch's output JSONL (one {'custom_id', 'response': {'status_code', 'body'}, 'error'} per line) to a path.
+    """
+
+    async def submit(self, path: str):
+        raise NotImplementedError
+
+    async def status(self, batch_id: str):
+        raise NotImplementedError
+
+    async def results(self, batch_id: str, path: str):
+        raise NotImplementedError
+
+class AzureBatchBackend(BatchBackend):
+    """
+    Azure OpenAI batch jobs (global batch deployments, API version 2024-07-01-preview or later) through the client of an AzureOpenAIBackend.
+
+    Without a backend the process-wide one is used, so batch jobs share its configuration and connection pool.
+    """
+
+    def __init__(self, backend = None, completion_window = '24h') -> None:
+        self._backend = backend
+        self.completion_window = completion_window
+        self.output_files = {}
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            from utils.backends import get_default_backend
+            self._backend = get_default_backend()
+        return self._backend
+
+    async def submit(self, path: str):
+
+        import openai
+
+        client = self.backend.client.async_client
+        try:
+            with open(path, 'rb') as file:
+                input_file = await client.files.create(file = file, purpose = 'batch')
+            batch = await client.batches.create(input_file_id = input_file.id, endpoint = '/chat/completions', completion_window = self.completion_window)
+        except openai.OpenAIError as e:
+            raise self.backend.to_backend_error(e) from e
+        return batch.id
+
+    async def status(self, batch_id: str):
+
+        import openai
+
+        try:
+            batch = await self.backend.client.async_client.batches.retrieve(batch_id)
+        except openai.OpenAIError as e:
+            raise self.backend.to_backend_error(e) from e
+
+        # requests that failed validation end up in the error file, not the output file
+        self.output_files[batch_id] = [file_id for file_id in [batch.output_file_id, batch.error_file_id] if file_id]
+        return batch.status
+
+    async def results(self, batch_id: str, path: str):
+
+        import openai
+
+        with open(path, 'w') as file:
+            for file_id in self.output_files.get(batch_id, []):
+                try:
+                    content = await self.backend.client.async_client.files.content(file_id)
+                except openai.OpenAIError as e:
+                    raise self.backend.to_backend_error(e) from e
+                text = content.text
+                file.write(text if text.endswith('\n') or not text else text + '\n')
+
+class LocalBatchBackend(BatchBackend):
+    """
+    Local stand-in for a batch API: submit() runs every request of the file through an ordinary chat Backend (a MockBackend by
+    default) and keeps the output in memory, so the batch is complete by the first status() call.
+    """
+
+    def __init__(self, backend = None) -> None:
+        if backend is None:
+            from utils.backends import MockBackend
+            backend = MockBackend()
+        self.backend = backend
+        self.outputs = {}
+        self.n_batches = 0
+
+    async def submit(self, path: str):
+
+        with open(path, 'r') as file:
+            requests = [json.loads(line) for line in file if line.strip()]
+
+        self.n_batches += 1
+        batch_id = f'batch_local_{self.n_batches}'
+        self.outputs[batch_id] = await asyncio.gather(*[self.run(request) for request in requests])
+        return batch_id
+
+    async def run(self, request: dict):
+
+        body = request['body']
+        try:
+            response, usage = await self.backend.chat(body['messages'], deployment_name = body.get('model'), temperature = body.get('temperature', 0.0), max_tokens = body.get('max_tokens'))
+        except BackendError as e:
+            return {'custom_id': request['custom_id'], 'response': {'status_code': e.status_code or 500, 'body': {'error': {'message': str(e)}}}, 'error': None}
+
+        usage = provider_usage(usage)
+        return {'custom_id': request['custom_id'],
+                'response': {'status_code': 200, 'body': {'object': 'chat.completion', 'model': body.get('model'), 'usage': usage,
+                                                          'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': response}}]}},
+                'error': None}
+
+    async def status(self, batch_id: str):
+        return 'completed' if batch_id in self.outputs else 'failed'
+
+    async def results(self, batch_id: str, path: str):
+        with open(path, 'w') as file:
+            for line in self.outputs.pop(batch_id, []):
+                file.write(json.dumps(line) + '\n')
+
+class BatchCollector:
+    """
+    Collects the chat calls of `phases` from any number of agents and debates into batch jobs instead of the interactive path.
+
+    Agents await BatchCollector.chat() like a backend call; requests pile up until `max_batch_size` are waiting or `max_wait_s`
+    passed since the first, then they are written to a JSONL request file in `directory`, submitted to the BatchBackend and polled
+    every `poll_interval_s` until done, and the results file is ingested to resume the waiting agents. Raise max_wait_s so a
+    tournament's concurrent debates share jobs. `deployments` maps an interactive deployment to its batch deployment.
+    """
+
+    def __init__(self, backend: BatchBackend = None, phases = BATCH_PHASES, directory = 'batches', max_batch_size = 1000,
+                 max_wait_s = 1.0, poll_interval_s = 10.0, deployments = None) -> None:
+
+        self.backend = backend or LocalBatchBackend()
+        self.phases = set(phases)
+        self.directory = directory
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_s
+        self.poll_interval_s = poll_interval_s
+        self.deployments = deployments or {}
+
+        self.pending = []
+        self.timer = None
+        # running flush tasks; the loop only keeps weak references to tasks, an unreferenced flush could vanish mid-job
+        self.flushes = set()
+        self.n_requests = 0
+        self.n_batches = 0
+        self.n_failed = 0
+        self.batch_ids = []
+        # request and result files of different runs sharing a directory must not overwrite each other
+        self.run_id = uuid.uuid4().hex[:8]
+
+    async def chat(self, messages: "list[dict]", deployment_name: str, temperature = 0.0, max_tokens = None):
+        """Return (response, usage) once the batch job carrying this request has completed."""
+
+        body = {'model': self.deployments.get(deployment_name, deployment_name), 'messages': messages, 'temperature': temperature}
+        if max_tokens is not None:
+            body['max_tokens'] = max_tokens
+
+        self.n_requests += 1
+        request = {'custom_id': f'{self.run_id}-{self.n_requests}', 'method': 'POST', 'url': '/chat/completions', 'body': body}
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((request, future))
+
+        if len(self.pending) >= self.max_batch_size:
+            self.start_flush(self.flush())
+        elif self.timer is None:
+            self.timer = self.start_flush(self.flush_later())
+
+        return await future
+
+    def start_flush(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self.flushes.add(task)
+        task.add_done_callback(self.flushes.discard)
+        return task
+
+    async def flush_later(self):
+        await asyncio.sleep(self.max_wait_s)
+        await self.flush()
+
+    async def flush(self):
+
+        pending, self.pending = self.pending, []
+        if self.timer is not None and self.timer is not asyncio.current_task():
+            self.timer.cancel()
+        self.timer = None
+        if not pending:
+            return
+
+        self.n_batches += 1
+        requests_path = os.path.join(self.directory, f'{self.run_id}-batch-{self.n_batches}-requests.jsonl')
+        results_path = os.path.join(self.directory, f'{self.run_id}-batch-{self.n_batches}-results.jsonl')
+
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+            with open(requests_path, 'w') as file:
+                for request, _ in pending:
+                    file.write(json.dumps(request) + '\n')
+
+            results = await self.run_batch(requests_path, results_path)
+        except Exception as e:
+            # the whole job failed, every request in it fails the same way (and may be retried into a later job)
+            self.n_failed += len(pending)
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for request, future in pending:
+            if future.done():
+                continue
+            try:
+                future.set_result(self.ingest(results.get(request['custom_id'])))
+            except BackendError as e:
+                self.n_failed += 1
+                future.set_exception(e)
+
+    async def run_batch(self, requests_path: str, results_path: str):
+
+        batch_id = await self.backend.submit(requests_path)
+        self.batch_ids.append(batch_id)
+
+        status = await self.backend.status(batch_id)
+        while status not in FINAL_STATUSES:
+            await asyncio.sleep(self.poll_interval_s)
+            status = await self.backend.status(batch_id)
+        if status != 'completed':
+            raise BackendError(f'Batch {batch_id} {status}')
+
+        await self.backend.results(batch_id, results_path)
+        with open(results_path, 'r') as file:
+            lines = [json.loads(line) for line in file if line.strip()]
+        return {line['custom_id']: line for line in lines}
+
+    def ingest(self, line: dict):
+
+        if line is None:
+            raise BackendError('Request missing from the batch results')
+        if line.get('error'):
+            raise BackendError(line['error'].get('message', str(line['error'])), status_code = line['response']['status_code'] if line.get('response') else None)
+
+        response = line['response']
+        if response['status_code'] != 200:
+            error = response['body'].get('error') or {}
+            raise BackendError(error.get('message', f"Batch request failed with status {response['status_code']}"), status_code = response['status_code'])
+
+        body = response['body']
+        return body['choices'][0]['message']['content'], normalize_usage(body['usage'])
+
+    def stats(self):
+        return {'n_requests': self.n_requests, 'n_batches': self.n_batches, 'n_failed': self.n_failed, 'batch_ids': list(self.batch_ids)}
@@ -0,0 +1,180 @@
+"""
+Orchestration micro-benchmarks: everything Debate and Agent cost apart from waiting on the network.
+
+Full debates run against a zero-latency MockBackend over a grid of rounds, talking points and response lengths, reporting
+CPU time per phase, allocations and peak memory; a few hot helpers are timed on their own, and so is a cold import of
+utils.debate. Results can be saved as a baseline and later runs compared against it to catch regressions.
+"""
+
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+from utils.agent import Agent
+from utils.backends import MockBackend
+from utils.debate import Debate
+from utils.events import PhaseEvent
+from utils.funcs import num_tokens_from_messages, run_sync
+from utils.transcript import Transcript
+
+class PhaseTimer:
+    """Attributes process CPU time to the debate phase that was running, using the debate's phase events."""
+
+    def __init__(self) -> None:
+        self.cpu_s = {}
+        self.phase = 'init'
+        self.last = time.process_time()
+
+    def __call__(self, event):
+        if isinstance(event, PhaseEvent):
+            self.switch(event.phase)
+
+    def switch(self, phase):
+        now = time.process_time()
+        self.cpu_s[self.phase] = self.cpu_s.get(self.phase, 0.0) + now - self.last
+        self.phase, self.last = phase, now
+
+async def run_mock_debate_async(n_talking_points, n_rounds, response_tokens, events_subscriber = None):
+
+    debate = Debate('Which one is the better pet? Cats or dogs?', n_talking_points = n_talking_points, n_rounds = n_rounds,
+                    setup = False, backend = MockBackend(response_tokens = response_tokens), verbose = False)
+    if events_subscriber is not None:
+        debate.events.subscribe(events_subscriber)
+
+    await debate.setup_async()
+    await debate.debate_async()
+    return debate
+
+def bench_debate(n_talking_points, n_rounds, response_tokens, repeats = 3):
+
+    cpu_s = []
+    phase_cpu_s = {}
+    for _ in range(repeats):
+        timer = PhaseTimer()
+        start = time.process_time()
+        debate = run_sync(run_mock_debate_async(n_talking_points, n_rounds, response_tokens, timer))
+        cpu_s.append(time.process_time() - start)
+        timer.switch('done')
+        for phase, seconds in timer.cpu_s.items():
+            phase_cpu_s.setdefault(phase, []).append(seconds)
+
+    # a separate pass for memory, tracemalloc would distort the timings
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    run_sync(run_mock_debate_async(n_talking_points, n_rounds, response_tokens))
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    allocations = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+
+    return {'n_talking_points': n_talking_points,
+            'n_rounds': n_rounds,
+            'response_tokens': response_tokens,
+            'n_calls': len(debate.calls()),
+            'cpu_s': min(cpu_s),
+            'cpu_s_per_call': min(cpu_s) / len(debate.calls()),
+            'phase_cpu_s': {phase: min(seconds) for phase, seconds in phase_cpu_s.items()},
+            'allocated_blocks': allocations,
+            'peak_memory_bytes': peak}
+
+def bench_helpers(response_tokens = 200, n_messages = 20, number = 200):
+
+    text = ' '.join(['argument'] * response_tokens)
+    messages = [{'role': 'system', 'content': 'You are debater #1.'}] + [{'role': 'user', 'content': text}] * n_messages
+
+    def add_message_to_memory():
+        agent = Agent('bench', backend = MockBackend())
+        for message in messages:
+            agent.add_message_to_memory(role = message['role'], message = message['content'])
+
+    def render_transcript():
+        agent = Agent('debater_1', backend = MockBackend())
+        transcript = Transcript()
+        for n in range(n_messages // 2):
+            transcript.add(agent, text, f'round_{n+1}', talking_point = 'bench', round = n+1)
+            transcript.add(agent, text, f'round_{n+1}', talking_point = 'bench', round = n+1)
+        transcript.render_rounds('bench')
+
+    helpers = {'num_tokens_from_messages': lambda: num_tokens_from_messages(messages),
+               'add_message_to_memory': add_message_to_memory,
+               'render_transcript': render_transcript}
+
+    return {name: min(timeit.repeat(helper, number = number, repeat = 3)) / number for name, helper in helpers.items()}
+
+# imported lazily on first use, importing utils.debate must not pull them in
+HEAVY_MODULES = ['openai', 'httpx', 'yaml', 'tiktoken', 'sqlite3']
+
+IMPORT_BUDGET_S = 0.25
+
+def bench_import(module = 'utils.debate', repeats = 5):
+    """Time a cold `import module` in fresh interpreters and list the heavy dependencies it loaded."""
+
+    code = ('import json, sys, time\n'
+            'start = time.perf_counter()\n'
+            f'import {module}\n'
+            'print(json.dumps({"import_s": time.perf_counter() - start,'
+            f' "heavy_modules": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))')
+    app_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    runs = [json.loads(subprocess.run([sys.executable, '-c', code], cwd = app_dir, capture_output = True, text = True, check = True).stdout)
+            for _ in range(repeats)]
+
+    return {'module': module, 'import_s': min(run['import_s'] for run in runs), 'heavy_modules': runs[0]['heavy_modules']}
+
+def check_import_budget(result, budget = IMPORT_BUDGET_S):
+    """Return the ways a bench_import result breaks the import budget (empty if it doesn't)."""
+
+    problems = []
+    if result['import_s'] > budget:
+        problems.append(f"importing {result['module']} took {result['import_s']:.3f}s, budget is {budget:.3f}s")
+    if result['heavy_modules']:
+        problems.append(f"importing {result['module']} loaded {', '.join(result['heavy_modules'])}")
+    return problems
+
+def run_benchmarks(rounds = (1, 2, 4), talking_points = (1, 3, 5), response_tokens = (50, 200), repeats = 3):
+
+    debates = [bench_debate(n_talking_points, n_rounds, n_tokens, repeats)
+               for n_talking_points, n_rounds, n_tokens in itertools.product(talking_points, rounds, response_tokens)]
+    return {'debates': debates, 'helpers': bench_helpers(), 'import': bench_import()}
+
+def benchmark_key(result):
+    return f"tp={result['n_talking_points']},rounds={result['n_rounds']},tokens={result['response_tokens']}"
+
+def compare_to_baseline(results, baseline, tolerance = 0.2):
+    """Return a list of regressions: metrics more than `tolerance` (relative) worse than the baseline."""
+
+    regressions = []
+
+    def check(name, value, baseline_value):
+        if baseline_value and value > baseline_value * (1 + tolerance):
+            regressions.append({'benchmark': name, 'value': value, 'baseline': baseline_value, 'ratio': value / baseline_value})
+
+    baseline_debates = {benchmark_key(result): result for result in baseline.get('debates', [])}
+    for result in results['debates']:
+        previous = baseline_debates.get(benchmark_key(result))
+        if previous is None:
+            continue
+        for metric in ['cpu_s', 'allocated_blocks', 'peak_memory_bytes']:
+            check(f'{benchmark_key(result)}:{metric}', result[metric], previous[metric])
+
+    for name, seconds in results['helpers'].items():
+        check(f'helper:{name}', seconds, baseline.get('helpers', {}).get(name))
+
+    if 'import' in results:
+        check(f"import:{results['import']['module']}", results['import']['import_s'], baseline.get('import', {}).get('import_s'))
+
+    return regressions
+
+def save_baseline(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent = 2)
+
+def load_baseline(path):
+    with open(path, 'r') as file:
+        return json.load(file)
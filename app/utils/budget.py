@@ -0,0 +1,73 @@
+import math
+
+class BudgetExceeded(Exception):
+    """Raised before a call that would break a hard budget when the debate cannot degrade any further (or is set to 'abort')."""
+
+    def __init__(self, message: str, budget = None) -> None:
+        super().__init__(message)
+        self.budget = budget
+
+class SkipRemainingRounds(Exception):
+    # control flow: the talking point goes straight to the moderator's evaluation
+    pass
+
+class SkipToVerdict(Exception):
+    # control flow: the remaining talking points are dropped and the Master gives the verdict on what was debated
+    pass
+
+class Budget:
+    """
+    Hard limits on tokens and € for everything charged to it: one debate, or a whole run when the same Budget is shared between debates.
+
+    Agents charge every usage they pay for as it happens (cache hits are free), so `spent_tokens` and `spent_cost` are live;
+    Debate checks the projected cost of each ask against all of its budgets before sending it, see Debate.check_budgets.
+    """
+
+    def __init__(self, max_tokens = None, max_cost = None, name = 'debate') -> None:
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.name = name
+        self.spent_tokens = 0
+        self.spent_cost = 0.0
+        self.n_calls = 0
+        # projected cost of the calls in flight, so concurrent talking points and debates cannot all pass the check at once
+        self.held_tokens = 0
+        self.held_cost = 0.0
+
+    def charge(self, tokens: int, cost: float):
+        self.spent_tokens += tokens
+        self.spent_cost += cost
+        self.n_calls += 1
+
+    def hold(self, tokens: int, cost: float):
+        self.held_tokens += tokens
+        self.held_cost += cost
+
+    def release(self, tokens: int, cost: float):
+        self.held_tokens -= tokens
+        self.held_cost -= cost
+
+    def completion_allowance(self, prompt_tokens: int, input_price: float, output_price: float, reserved_tokens = 0, reserved_cost = 0.0):
+        """
+        How many completion tokens a call with this prompt can still afford while keeping `reserved_tokens` / `reserved_cost` back
+        (math.inf without limits, negative if not even the prompt fits).
+        """
+
+        allowance = math.inf
+        if self.max_tokens is not None:
+            allowance = min(allowance, self.max_tokens - self.spent_tokens - self.held_tokens - reserved_tokens - prompt_tokens)
+        if self.max_cost is not None:
+            allowance = min(allowance, (self.max_cost - self.spent_cost - self.held_cost - reserved_cost - prompt_tokens * input_price) / output_price)
+        return allowance
+
+    def stats(self):
+        return {'name': self.name,
+                'max_tokens': self.max_tokens,
+                'max_cost_€': self.max_cost,
+                'spent_tokens': self.spent_tokens,
+                'spent_cost_€': self.spent_cost,
+                'n_calls': self.n_calls,
+                'held_tokens': self.held_tokens,
+                'held_cost_€': self.held_cost,
+                'tokens_used_ratio': self.spent_tokens / self.max_tokens if self.max_tokens else None,
+                'cost_used_ratio': self.spent_cost / self.max_cost if self.max_cost else None}
@@ -0,0 +1,75 @@
+import hashlib
+import json
+import re
+import threading
+import time
+
+def make_cache_key(deployment_name: str, temperature: float, messages: "list[dict]"):
+    payload = json.dumps({'deployment_name': deployment_name, 'temperature': temperature, 'messages': messages}, sort_keys = True, ensure_ascii = False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+async def replay_response(response: str, usage: dict):
+    """Stream a cached response back as backend-style chunks."""
+    for token in re.findall(r'\s*\S+|\s+$', response):
+        yield {'content': token}
+    yield {'usage': usage}
+
+class ResponseCache:
+    """
+    Disk-backed (SQLite) cache of chat responses for deterministic calls, keyed on deployment, temperature and messages.
+
+    Holds at most `max_entries` responses; the least recently used ones are evicted first.
+    """
+
+    def __init__(self, path = '.response_cache.sqlite', max_entries = 10000) -> None:
+
+        import sqlite3
+
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        # agents may use the cache from run_sync's helper threads as well as the main loop
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread = False)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, usage TEXT, last_access REAL)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self.connection.commit()
+
+    def get(self, key: str):
+        """Return (response, usage) for `key`, or None on a miss."""
+
+        with self.lock:
+            row = self.connection.execute('SELECT response, usage FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.connection.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self.connection.commit()
+
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, response: str, usage: dict):
+
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, response, json.dumps(usage), time.time()))
+            self.connection.execute('DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self)}
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM responses')
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,88 @@
+import gzip
+import json
+import os
+
+class Checkpoint:
+    """
+    On-disk record of a debate's completed turns: every turn is appended to a JSONL journal next to `path` as it completes,
+    and the journal is compacted into one gzip JSON snapshot at `path` (temp file + rename) once the debate finishes.
+
+    Each player's ask is stored under a stable key (player, talking point, n-th ask there) with its response, usage and
+    call records. Resuming re-runs the debate and serves every recorded turn from here instead of the backend, which
+    rebuilds the instructions, talking points, memories and summaries without issuing any paid call twice.
+    """
+
+    def __init__(self, path: str, meta = None, turns = None) -> None:
+        self.path = path
+        self.journal_path = self.journal_path_for(path)
+        # the debate's settings, so Debate.resume can rebuild it
+        self.meta = meta or {}
+        self.turns = turns or {}
+        # what the journal already says about meta, it is only appended again when it changed
+        self.journaled_meta = None
+
+    @staticmethod
+    def journal_path_for(path: str):
+        return f'{path}.journal'
+
+    @classmethod
+    def exists(cls, path: str):
+        return os.path.exists(path) or os.path.exists(cls.journal_path_for(path))
+
+    @classmethod
+    def load(cls, path: str):
+
+        meta, turns = {}, {}
+        if os.path.exists(path):
+            with gzip.open(path, 'rt') as file:
+                state = json.load(file)
+            meta, turns = state['meta'], state['turns']
+
+        checkpoint = cls(path, meta = meta, turns = turns)
+        if os.path.exists(checkpoint.journal_path):
+            with open(checkpoint.journal_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the process died in the middle of this line, the turn simply runs again
+                        break
+                    if 'meta' in entry:
+                        checkpoint.meta = entry['meta']
+                    else:
+                        checkpoint.turns[entry['key']] = entry['turn']
+            # start the resumed debate from a clean snapshot rather than appending after a torn line
+            checkpoint.compact()
+        return checkpoint
+
+    def __contains__(self, key: str):
+        return key in self.turns
+
+    def get(self, key: str):
+        return self.turns.get(key)
+
+    def record(self, key: str, turn: dict):
+        self.turns[key] = turn
+
+        # a short append per turn; closing flushes it, which survives a crashed process (no fsync, this runs on the event loop)
+        with open(self.journal_path, 'a') as file:
+            if self.meta != self.journaled_meta:
+                file.write(json.dumps({'meta': self.meta}, separators = (',', ':')) + '\n')
+                self.journaled_meta = dict(self.meta)
+            file.write(json.dumps({'key': key, 'turn': turn}, separators = (',', ':')) + '\n')
+
+    def compact(self):
+        """Write everything recorded so far as the snapshot and drop the journal; once per debate, off the event loop if possible."""
+
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'wb') as raw:
+            with gzip.GzipFile(fileobj = raw, mode = 'wb', compresslevel = 6) as file:
+                file.write(json.dumps({'meta': self.meta, 'turns': self.turns}, separators = (',', ':')).encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        # a crash mid-write leaves the previous snapshot and the journal intact
+        os.replace(temp_path, self.path)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.journaled_meta = None
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import weakref
+
+class AzureOpenAIClient:
+    """
+    Explicit connection settings and pooled HTTP clients for an Azure OpenAI resource, instead of configuring the openai module globally.
+
+    Share one instance (through AzureOpenAIBackend) between every agent and debate: keep-alive connections are then reused
+    across calls instead of paying a TLS handshake per call. `max_connections` bounds concurrent connections, idle ones are
+    kept for `keepalive_expiry` seconds. Retries are left to utils.retry, so the openai client's own retries are off by default.
+
+    httpx async clients are bound to the event loop that created them, so one pool is kept per running loop.
+    """
+
+    def __init__(self, api_key: str, endpoint: str, deployment_name = None, api_version = '2024-06-01', max_connections = 100,
+                 max_keepalive_connections = 20, keepalive_expiry = 30.0, timeout = 60.0, connect_timeout = 10.0, max_retries = 0) -> None:
+
+        self.api_key = api_key
+        # the config only holds the resource name, a full URL works as well
+        self.endpoint = endpoint if endpoint.startswith('http') else f'https://{endpoint}.openai.azure.com'
+        self.deployment_name = deployment_name
+        self.api_version = api_version
+
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+
+        self._lock = threading.Lock()
+        self._sync_client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_config(cls, config_path = None, config = None, **kwargs):
+        """Build a client from the settings utils.config.load_config resolves (explicit config, file, environment)."""
+
+        from utils.config import load_config
+
+        config = load_config(config, config_path)
+        return cls(api_key = config['api'], endpoint = config['endpoint'], deployment_name = config.get('deployment'), **kwargs)
+
+    def http_options(self):
+
+        import httpx
+
+        return {'limits': httpx.Limits(max_connections = self.max_connections,
+                                       max_keepalive_connections = self.max_keepalive_connections,
+                                       keepalive_expiry = self.keepalive_expiry),
+                'timeout': httpx.Timeout(self.timeout, connect = self.connect_timeout)}
+
+    def openai_options(self):
+        return {'api_key': self.api_key, 'azure_endpoint': self.endpoint, 'api_version': self.api_version, 'max_retries': self.max_retries}
+
+    @property
+    def sync_client(self):
+        """openai.AzureOpenAI for synchronous code such as notebooks, created on first use."""
+
+        with self._lock:
+            if self._sync_client is None:
+                import httpx
+                import openai
+                self._sync_client = openai.AzureOpenAI(http_client = httpx.Client(**self.http_options()), **self.openai_options())
+            return self._sync_client
+
+    @property
+    def async_client(self):
+        """openai.AsyncAzureOpenAI pooled for the running event loop."""
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._async_clients.get(loop)
+            if client is None:
+                import httpx
+                import openai
+                client = self._async_clients[loop] = openai.AsyncAzureOpenAI(http_client = httpx.AsyncClient(**self.http_options()), **self.openai_options())
+            return client
+
+    async def aclose(self):
+        """Close the running loop's pool; call before the loop ends to release its connections cleanly."""
+
+        with self._lock:
+            client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def close(self):
+
+        with self._lock:
+            client, self._sync_client = self._sync_client, None
+        if client is not None:
+            client.close()
@@ -0,0 +1,33 @@
+import os
+
+# config.yml at the repository root, independent of the working directory
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'config.yml')
+
+CONFIG_PATH_ENV = 'LLM_DEBATE_CONFIG'
+ENV_VARS = {'api': 'AZURE_OPENAI_API_KEY', 'endpoint': 'AZURE_OPENAI_ENDPOINT', 'deployment': 'AZURE_OPENAI_DEPLOYMENT'}
+
+def load_config(config = None, path = None):
+    """
+    Resolve the Azure OpenAI settings ({'api', 'endpoint', 'deployment'}), first match wins:
+
+    1. `config`, a dict (or an object with those attributes), either the settings themselves or a full config with an az_oai section
+    2. `path`, a YAML config file
+    3. the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_DEPLOYMENT environment variables
+    4. the YAML file named by $LLM_DEBATE_CONFIG, else config.yml at the repository root
+
+    Nothing is read before the first call, and yaml is only imported when a file is.
+    """
+
+    if config is not None:
+        if not isinstance(config, dict):
+            config = vars(config)
+        return dict(config.get('az_oai', config))
+
+    if path is None and os.environ.get(ENV_VARS['api']) and os.environ.get(ENV_VARS['endpoint']):
+        return {key: os.environ.get(var) for key, var in ENV_VARS.items()}
+
+    import yaml
+
+    path = path or os.environ.get(CONFIG_PATH_ENV) or DEFAULT_CONFIG_PATH
+    with open(path, 'r') as file:
+        return yaml.safe_load(file)['az_oai']
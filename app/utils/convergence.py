@@ -0,0 +1,72 @@
+import re
+
+from utils.prompts import convergence_check_system_message, convergence_check_instruction
+
+WORD = re.compile(r'\w+')
+
+def ngrams(text: str, n = 3):
+    words = WORD.findall(text.lower())
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+def novelty(text: str, previous_texts: "list[str]", n = 3):
+    """Fraction of text's word n-grams that none of previous_texts contains: 1.0 is entirely new, 0.0 a pure repeat."""
+    new = ngrams(text, n)
+    if not new:
+        return 0.0
+    seen = set().union(*[ngrams(previous_text, n) for previous_text in previous_texts])
+    return len(new - seen) / len(new)
+
+class EarlyStopping:
+    """
+    Ends a talking point before its last round once the debaters stop saying anything new.
+
+    After each round from `min_rounds` on, every answer of the round is scored by its n-gram novelty against the
+    talking point's earlier answers; the round has converged when even the most novel answer is below `threshold`.
+    With `moderator_check` a short call to the moderator must then confirm that the debaters are repeating themselves.
+    """
+
+    def __init__(self, threshold = 0.3, ngram = 3, min_rounds = 2, moderator_check = False) -> None:
+        self.threshold = threshold
+        self.ngram = ngram
+        self.min_rounds = min_rounds
+        self.moderator_check = moderator_check
+
+    def round_novelty(self, turns, round: int):
+        previous_texts = [turn.text for turn in turns if turn.round < round]
+        scores = [novelty(turn.text, previous_texts, self.ngram) for turn in turns if turn.round == round]
+        return max(scores) if scores else 1.0
+
+    async def should_stop(self, transcript, talking_point, round: int, moderator = None, ask = None):
+        """Return (stop, novelty) for the round that just finished; `ask(agent, phase)` sends the moderator check (default: agent.ask_async)."""
+
+        if round < self.min_rounds:
+            return False, None
+
+        score = self.round_novelty(transcript.round_turns(talking_point), round)
+        if score >= self.threshold:
+            return False, score
+
+        if self.moderator_check and moderator is not None:
+            return await self.moderator_agrees(moderator, transcript.render_rounds(talking_point), talking_point, round, ask), score
+        return True, score
+
+    async def moderator_agrees(self, moderator, rendered_transcript: str, talking_point, round: int, ask = None):
+
+        # a fork with its own name, so the check is recorded (and checkpointed) apart from the moderator's turns;
+        # every fork starts from the moderator's turn counts, so the round numbers the check's turn key to keep checks apart
+        judge = moderator.fork()
+        judge.name = f'{moderator.name}_convergence_check'
+        judge.turn_counts = {talking_point: round}
+        judge.compaction = None
+        judge.truncate_memory(0)
+        judge.add_message_to_memory(role='system', message=convergence_check_system_message)
+        judge.add_message_to_memory(role='user', message=convergence_check_instruction.format(current_talking_point=talking_point, transcript=rendered_transcript))
+
+        try:
+            answer = await ask(judge, 'convergence_check') if ask is not None else await judge.ask_async(phase='convergence_check')
+        finally:
+            # also when the budget check refuses the call, whatever was spent stays on the moderator's bill
+            moderator.merge_usage(judge)
+        # the answer's first word, so 'NOT REPEATING' (or an explanation mentioning the word) is no verdict of convergence
+        words = WORD.findall(answer.upper())
+        return bool(words) and words[0] == 'REPEATING'
@@ -1,34 +1,251 @@
 from utils.agent import Agent
+from utils.retry import RetryPolicy
+from utils.events import EventBus, ConsolePrinter, PhaseEvent
+from utils.metrics import summarize_calls, export_calls_jsonl, to_prometheus, budgets_to_prometheus
+from utils.funcs import run_sync, num_tokens_from_text
+from utils.checkpoint import Checkpoint
+from utils.transcript import Transcript
+from utils.budget import Budget, BudgetExceeded, SkipRemainingRounds, SkipToVerdict
+from utils.batch import BATCH_SUFFIX
+from utils.tracing import Tracer
 
 from utils.prompts import master_prompt_system_message, master_prompt_instruction, master_prompt_instruction_second_debater, master_prompt_instruction_final_evalation
 from utils.prompts import moderator_system_message, moderator_prompt_instruction, moderator_talking_point_eval_instruction
 from utils.prompts import debater_1_system_message, debater_1_prompt_instruction, debater_2_system_message, debater_2_prompt_instruction
 
+import asyncio
+import uuid
+from contextlib import nullcontext
 from collections import Counter
 
 #sample: https://github.com/Skytliang/Multi-Agents-Debate/blob/main/interactive.py
 
 class Debate:
 
-    def __init__(self, topic, n_talking_points = 2, n_rounds = 1) -> None:
+    # messages at the start of each role's memory that compaction must keep: system prompt, task instruction (and the moderator's agenda)
+    N_PINNED_MESSAGES = {'master': 1, 'moderator': 3, 'debater': 2}
+
+    # an answer capped below this many tokens is not worth asking for, the debate degrades further instead
+    MIN_BUDGET_COMPLETION_TOKENS = 32
+
+    def __init__(self, topic, n_talking_points = 2, n_rounds = 1, setup = True, backend = None, cache = None, compaction = None,
+                 events = None, verbose = True, retry_policy = RetryPolicy(), circuit_breaker = None,
+                 rate_limiter = None, checkpoint = None, transcript_path = None, early_stopping = None,
+                 router = None, prices = None, token_budget = None, cost_budget = None, budget_mode = 'skip_rounds', run_budget = None,
+                 batch = None, tracer: Tracer = None) -> None:
 
         self.topic = topic
+
+        # a utils.checkpoint.Checkpoint (or its path) every completed turn is saved to, see Debate.resume
+        if isinstance(checkpoint, str):
+            checkpoint = Checkpoint(checkpoint)
+        self.checkpoint = checkpoint
+        self.debate_id = checkpoint.meta['debate_id'] if checkpoint is not None and checkpoint.meta else uuid.uuid4().hex[:12]
+        if checkpoint is not None:
+            checkpoint.meta = {'debate_id': self.debate_id, 'topic': topic, 'n_talking_points': n_talking_points, 'n_rounds': n_rounds,
+                               'token_budget': token_budget, 'cost_budget': cost_budget, 'budget_mode': budget_mode}
+
+        # everything the debate narrates goes through the event bus; verbose adds the console printer as one of its sinks
+        self.events = events or EventBus()
+        if verbose:
+            self.console_printer = self.events.subscribe(ConsolePrinter())
+        self.backend = backend
+        self.cache = cache
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.rate_limiter = rate_limiter
+        # utils.routing.Router choosing a deployment per role and phase, and the € per 1000 tokens price table per deployment
+        self.router = router
+        self.prices = prices
+        # optional utils.batch.BatchCollector: calls of its phases (setup, evaluations, verdict) go out as batch jobs
+        self.batch = batch
+        # optional utils.tracing.Tracer: spans for every phase of the debate and every agent call, the debate's own process in the trace
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.pid(self.debate_id, name = f'{topic} ({self.debate_id})')
+        # per role ('master', 'moderator', 'debater') utils.memory.CompactionStrategy
+        self.compaction = compaction or {}
         self.n_talking_points = n_talking_points
         self.n_rounds = n_rounds
+        # optional utils.convergence.EarlyStopping; rounds run, novelty scores and estimated savings per talking point
+        self.early_stopping = early_stopping
+        self.early_stopping_stats = {}
+
+        # hard limits in tokens and € for this debate, and optionally a utils.budget.Budget shared by the whole run; every ask is
+        # checked against both before it is sent. When the projected cost does not fit, budget_mode decides what gives:
+        # 'cap' caps the answer's max_tokens, 'skip_rounds' skips the talking point's remaining rounds (straight to the moderator),
+        # 'verdict' skips everything left but the Master's verdict, 'abort' raises utils.budget.BudgetExceeded.
+        # Whatever cannot be skipped (setup, evaluations, the verdict) is capped, and the debate aborts when not even that fits.
+        self.budget = Budget(token_budget, cost_budget) if token_budget is not None or cost_budget is not None else None
+        self.run_budget = run_budget
+        self.budgets = [budget for budget in [self.budget, run_budget] if budget is not None]
+        self.budget_mode = budget_mode
+        self.budget_degradations = []
+        self.skipping_to_verdict = False
+
+        # structured turn records, streamed to transcript_path (JSONL, .gz to compress) as turns complete
+        self.transcript = Transcript(transcript_path, debate_id = self.debate_id)
 
         self.create_players()
         self.set_system_prompts()
-        self.assign_debaters()
-        self.set_talking_points()
+
+        # with setup = False the caller is expected to `await debate.setup_async()` on its own event loop
+        if setup:
+            self.setup()
+
+    @classmethod
+    def resume(cls, path, setup = True, **kwargs):
+        """
+        Rebuild a debate from its checkpoint file; turns it already completed are replayed from the file, not the backend.
+
+        Call debate() (or debate_async()) on the result to finish it. kwargs are the remaining constructor arguments (backend, cache, ...).
+        """
+
+        checkpoint = Checkpoint.load(path)
+        settings = {key: value for key, value in checkpoint.meta.items() if key != 'debate_id'}
+        return cls(setup = setup, checkpoint = checkpoint, **settings, **kwargs)
+
+    def setup(self):
+        return run_sync(self.setup_async())
+
+    async def setup_async(self):
+
+        with self.span('setup', lane = 'debate'):
+            with self.span('assign_debaters'):
+                await self.assign_debaters_async()
+            with self.span('set_talking_points'):
+                await self.set_talking_points_async()
 
         self.moderator_talking_points_list = [i.strip() for i in self.moderator_talking_points.split(';')]
 
     def create_players(self):
 
-        self.MASTER = Agent('master')
-        self.MODERATOR = Agent('moderator')
-        self.DEBATER_1 = Agent('debater_1')
-        self.DEBATER_2 = Agent('debater_2')
+        self.MASTER = self.create_player('master', 'master')
+        self.MODERATOR = self.create_player('moderator', 'moderator')
+        self.DEBATER_1 = self.create_player('debater_1', 'debater')
+        self.DEBATER_2 = self.create_player('debater_2', 'debater')
+
+    def create_player(self, name, role):
+        agent = Agent(name, backend=self.backend, cache=self.cache, role=role, retry_policy=self.retry_policy, circuit_breaker=self.circuit_breaker,
+                      rate_limiter=self.rate_limiter, checkpoint=self.checkpoint, router=self.router, prices=self.prices, budgets=self.budgets, batch=self.batch, tracer=self.tracer,
+                      compaction=self.compaction.get(role), n_pinned_messages=self.N_PINNED_MESSAGES[role], events=self.events)
+        agent.event_context['debate_id'] = self.debate_id
+        return agent
+
+    def emit_phase(self, phase, talking_point = None, round = None):
+        self.events.emit(PhaseEvent(debate_id=self.debate_id, talking_point=talking_point, phase=phase, round=round))
+
+    def span(self, name, lane = None, **args):
+        # a no-op without a tracer
+        if self.tracer is None:
+            return nullcontext(args)
+        return self.tracer.span(name, process=self.debate_id, lane=lane, **args)
+
+    def instant(self, name, **args):
+        if self.tracer is not None:
+            self.tracer.instant(name, process=self.debate_id, **args)
+
+    async def turn(self, agent, phase, talking_point = None, round = None):
+        response = await self.ask(agent, phase)
+        # the turn is kept once in the transcript, agents remember it by reference
+        return self.transcript.add(agent, response, phase, talking_point=talking_point, round=round)
+
+    async def ask(self, agent, phase):
+        # every call of the debate, turns or not (e.g. the moderator's convergence check), goes out through the budget check
+        max_tokens, held = self.check_budgets(agent, phase)
+        try:
+            return await agent.ask_async(phase=phase, max_tokens=max_tokens)
+        finally:
+            for budget in self.budgets:
+                budget.release(*held)
+
+    def check_budgets(self, agent, phase):
+        """
+        Project the ask (the prompt as it stands, see Agent.projected_prompt_tokens, plus the agent's average answer, plus the
+        summary call its memory compaction would issue first) against every budget and return the max_tokens to cap it at (None if it fits) with the projected (tokens, €) held on the budgets until it completes.
+        Otherwise degrade as budget_mode says by raising SkipRemainingRounds / SkipToVerdict / BudgetExceeded.
+        """
+
+        if not self.budgets:
+            return None, (0, 0.0)
+
+        # rounds (and the convergence checks between them) and evaluations can be skipped, setup and the verdict cannot
+        kind = 'round' if phase.startswith('round_') or phase == 'convergence_check' else 'evaluation' if phase == 'moderator_eval' else 'essential'
+        if self.skipping_to_verdict and kind != 'essential':
+            raise SkipToVerdict()
+
+        # skippable turns must leave enough for the verdict, or capping them would just starve it
+        reserved_tokens, reserved_cost = self.verdict_reserve() if kind != 'essential' else (0, 0.0)
+        compaction = self.compaction_projection(agent)
+        reserved_tokens, reserved_cost = reserved_tokens + compaction[0], reserved_cost + compaction[1]
+        input_price, _, output_price = agent.price(agent.deployment_for(phase) or agent.backend.deployment_name)
+        prompt_tokens = agent.projected_prompt_tokens()
+        allowance = min(budget.completion_allowance(prompt_tokens, input_price, output_price, reserved_tokens, reserved_cost) for budget in self.budgets)
+        if allowance >= agent.expected_completion_tokens():
+            return None, self.hold(prompt_tokens, agent.expected_completion_tokens(), input_price, output_price, compaction)
+
+        talking_point = agent.event_context.get('talking_point')
+        if self.budget_mode == 'abort':
+            self.degrade('abort', phase, talking_point)
+            raise BudgetExceeded(f'{agent.name} {phase}: projected cost exceeds the budget')
+        if kind == 'round' and self.budget_mode == 'skip_rounds':
+            self.degrade('skip_rounds', phase, talking_point)
+            raise SkipRemainingRounds()
+        if kind != 'essential' and self.budget_mode == 'verdict':
+            self.degrade('skip_to_verdict', phase, talking_point)
+            raise SkipToVerdict()
+
+        if allowance >= self.MIN_BUDGET_COMPLETION_TOKENS:
+            self.degrade('cap_max_tokens', phase, talking_point, max_tokens = int(allowance))
+            return int(allowance), self.hold(prompt_tokens, int(allowance), input_price, output_price, compaction)
+
+        if kind == 'round':
+            self.degrade('skip_rounds', phase, talking_point)
+            raise SkipRemainingRounds()
+        if kind == 'evaluation':
+            self.degrade('skip_to_verdict', phase, talking_point)
+            raise SkipToVerdict()
+        self.degrade('abort', phase, talking_point)
+        raise BudgetExceeded(f'{agent.name} {phase}: not even {self.MIN_BUDGET_COMPLETION_TOKENS} completion tokens fit in the budget')
+
+    def hold(self, prompt_tokens, completion_tokens, input_price, output_price, extra = (0, 0.0)):
+        held = (prompt_tokens + completion_tokens + extra[0], prompt_tokens * input_price + completion_tokens * output_price + extra[1])
+        for budget in self.budgets:
+            budget.hold(*held)
+        return held
+
+    def compaction_projection(self, agent):
+        """Projected tokens and € of the summary call the agent's memory compaction issues before its next ask (nothing without one)."""
+
+        if agent.compaction is None:
+            return 0, 0.0
+        prompt_tokens, completion_tokens = agent.compaction.projected_call_tokens(agent)
+        if not prompt_tokens:
+            return 0, 0.0
+        input_price, _, output_price = agent.price(getattr(agent.compaction, 'deployment_name', None) or agent.deployment_for('compaction') or agent.backend.deployment_name)
+        return prompt_tokens + completion_tokens, prompt_tokens * input_price + completion_tokens * output_price
+
+    def verdict_reserve(self):
+        """Projected tokens and € of the Master's verdict: its prompt once every talking point's summary is in, plus its answer."""
+
+        prompt_tokens = (self.MASTER.projected_prompt_tokens() + num_tokens_from_text(master_prompt_instruction_final_evalation, self.MASTER.token_model)
+                         + len(self.moderator_talking_points_list) * self.MODERATOR.expected_completion_tokens())
+        completion_tokens = self.MASTER.expected_completion_tokens()
+        input_price, _, output_price = self.MASTER.price(self.MASTER.deployment_for('final_verdict') or self.MASTER.backend.deployment_name)
+        return prompt_tokens + completion_tokens, prompt_tokens * input_price + completion_tokens * output_price
+
+    def degrade(self, action, phase, talking_point = None, max_tokens = None):
+        if action == 'skip_to_verdict':
+            self.skipping_to_verdict = True
+        degradation = {'action': action, 'phase': phase, 'talking_point': talking_point}
+        if max_tokens is not None:
+            degradation['max_tokens'] = max_tokens
+        self.budget_degradations.append(degradation)
+        self.emit_phase(f'budget_{action}', talking_point = talking_point)
+        self.instant(f'budget_{action}', **degradation)
+
+    def players(self):
+        return [self.MASTER, self.MODERATOR, self.DEBATER_1, self.DEBATER_2]
 
     def set_system_prompts(self):
         self.MASTER.set_system_prompt(master_prompt_system_message)
@@ -37,21 +254,29 @@ class Debate:
         self.DEBATER_2.set_system_prompt(debater_2_system_message)
 
     def assign_debaters(self):
+        return run_sync(self.assign_debaters_async())
+
+    async def assign_debaters_async(self):
 
         self.MASTER.add_message_to_memory(role='user', message=master_prompt_instruction.format(topic = self.topic))
 
-        print('Debater #1 instructions given by Master')
-        self.debater_1_instruction = self.MASTER.ask()
+        self.emit_phase('assign_debater_1')
+        debater_1_instruction = await self.turn(self.MASTER, 'master_setup')
+        self.debater_1_instruction = debater_1_instruction.text
 
-        self.MASTER.add_message_to_memory(role='assistant', message=self.debater_1_instruction)
+        self.MASTER.add_message_to_memory(role='assistant', message=debater_1_instruction)
         self.MASTER.add_message_to_memory(role='user', message=master_prompt_instruction_second_debater)
 
-        print('\n\nDebater #2 instructions given by Master')
-        self.debater_2_instruction = self.MASTER.ask()
+        self.emit_phase('assign_debater_2')
+        debater_2_instruction = await self.turn(self.MASTER, 'master_setup')
+        self.debater_2_instruction = debater_2_instruction.text
 
-        self.MASTER.add_message_to_memory(role='assistant', message=self.debater_2_instruction)
+        self.MASTER.add_message_to_memory(role='assistant', message=debater_2_instruction)
 
     def set_talking_points(self):
+        return run_sync(self.set_talking_points_async())
+
+    async def set_talking_points_async(self):
 
         self.MODERATOR.add_message_to_memory(role='user', message=moderator_prompt_instruction.format(topic = self.topic, 
                                                                                                       debater_1_instruction = self.debater_1_instruction,
@@ -59,93 +284,259 @@ class Debate:
                                                                                                       n_talking_points = self.n_talking_points, 
                                                                                                       n_rounds = self.n_rounds))
         
-        print("\n\nModerator's talking points to construct debate")
-        self.moderator_talking_points = self.MODERATOR.ask()
-        self.MODERATOR.add_message_to_memory(role='assistant', message=self.moderator_talking_points)
-
-    def debate(self):
-
-        self.summaries = []
-        self.debates_for_each_talking_point = []
-
-        for current_talking_point in self.moderator_talking_points_list:
-
-            print('*' * 100)
-            print(f'Current talking point: {current_talking_point}')
-
-            self.DEBATER_1.add_message_to_memory(role='user', message=debater_1_prompt_instruction.format(topic = self.topic, 
-                                                                                                          debater_1_instruction = self.debater_1_instruction,
-                                                                                                          n_rounds = self.n_rounds, 
-                                                                                                          current_talking_point = current_talking_point))
-
-            self.DEBATER_2.add_message_to_memory(role='user', message=debater_2_prompt_instruction.format(topic = self.topic, 
-                                                                                                          debater_2_instruction = self.debater_2_instruction,
-                                                                                                          n_rounds = self.n_rounds, 
-                                                                                                          current_talking_point = current_talking_point))
-
-            Debate_Talking_Point_History_For_Moderator = ""
-            
+        self.emit_phase('set_talking_points')
+        moderator_talking_points = await self.turn(self.MODERATOR, 'talking_points')
+        self.moderator_talking_points = moderator_talking_points.text
+        self.MODERATOR.add_message_to_memory(role='assistant', message=moderator_talking_points)
+
+    def debate(self, parallel = False):
+        return run_sync(self.debate_async(parallel=parallel))
+
+    async def debate_async(self, parallel = False):
+
+        try:
+            with self.span('talking_points', lane = 'debate', parallel = parallel):
+                if parallel:
+                    # talking points are independent (memories are wiped between them), so each one runs on its own copy of the players
+                    players = [(self.DEBATER_1.fork(), self.DEBATER_2.fork(), self.MODERATOR.fork()) for _ in self.moderator_talking_points_list]
+                    tasks = [asyncio.ensure_future(self.debate_talking_point_async(current_talking_point, *point_players))
+                             for current_talking_point, point_players in zip(self.moderator_talking_points_list, players)]
+                    try:
+                        results = await asyncio.gather(*tasks)
+                    finally:
+                        # a failed talking point stops the others, and whatever they had spent until then still counts
+                        for task in tasks:
+                            task.cancel()
+                        await asyncio.gather(*tasks, return_exceptions = True)
+
+                        # fold usages back into the main players, keeping the original talking point order
+                        for debater_1, debater_2, moderator in players:
+                            self.DEBATER_1.merge_usage(debater_1)
+                            self.DEBATER_2.merge_usage(debater_2)
+                            self.MODERATOR.merge_usage(moderator)
+                else:
+                    results = []
+                    for current_talking_point in self.moderator_talking_points_list:
+                        if self.skipping_to_verdict:
+                            break
+                        results.append(await self.debate_talking_point_async(current_talking_point, self.DEBATER_1, self.DEBATER_2, self.MODERATOR))
+
+            # talking points dropped for the budget have no summary
+            self.summaries = [summary for summary in results if summary is not None]
+
+            # now it's the master's turn to take all of the moderator's notes, summarize what had happened and pick a final champion
+            self.MASTER.add_message_to_memory(role='user', message=master_prompt_instruction_final_evalation.format(talking_points = self.moderator_talking_points,
+                                                                                                                    moderator_notes = '\n'.join(self.summaries)))
+
+            self.emit_phase('final_verdict')
+            with self.span('final_verdict'):
+                master_final_champion_selection = await self.turn(self.MASTER, 'final_verdict')
+            self.master_final_champion_selection = master_final_champion_selection.text
+            self.MASTER.add_message_to_memory(role='assistant', message=master_final_champion_selection)
+
+            self.emit_phase('finished')
+
+            # fold the checkpoint's turn journal into one snapshot, off the event loop
+            if self.checkpoint is not None:
+                await asyncio.to_thread(self.checkpoint.compact)
+        finally:
+            # also when the debate fails, so a compressed transcript still gets its end marker
+            self.transcript.close()
+
+    async def debate_talking_point_async(self, current_talking_point, DEBATER_1, DEBATER_2, MODERATOR):
+
+        with self.span('talking_point', lane = current_talking_point, talking_point = current_talking_point) as span:
+            try:
+                return await self.talking_point_async(current_talking_point, DEBATER_1, DEBATER_2, MODERATOR)
+            except SkipToVerdict:
+                # the budget only leaves room for the verdict
+                span['skipped_to_verdict'] = True
+                self.drop_talking_point(current_talking_point, DEBATER_1, DEBATER_2, MODERATOR)
+                return None
+
+    def drop_talking_point(self, current_talking_point, DEBATER_1, DEBATER_2, MODERATOR):
+        # a talking point left without the moderator's evaluation: leave the players as the talking point would have
+        DEBATER_1.empty_memory_for_next_talking_point()
+        DEBATER_2.empty_memory_for_next_talking_point()
+        MODERATOR.empty_memory_for_moderator_for_next_talking_point_summary()
+        for agent in [DEBATER_1, DEBATER_2, MODERATOR]:
+            agent.event_context.pop('talking_point', None)
+        self.transcript.finish_talking_point(current_talking_point)
+
+    async def talking_point_async(self, current_talking_point, DEBATER_1, DEBATER_2, MODERATOR):
+
+        for agent in [DEBATER_1, DEBATER_2, MODERATOR]:
+            agent.event_context['talking_point'] = current_talking_point
+        self.emit_phase('talking_point', talking_point = current_talking_point)
+
+        DEBATER_1.add_message_to_memory(role='user', message=debater_1_prompt_instruction.format(topic = self.topic, 
+                                                                                                 debater_1_instruction = self.debater_1_instruction,
+                                                                                                 n_rounds = self.n_rounds, 
+                                                                                                 current_talking_point = current_talking_point))
+
+        DEBATER_2.add_message_to_memory(role='user', message=debater_2_prompt_instruction.format(topic = self.topic, 
+                                                                                                 debater_2_instruction = self.debater_2_instruction,
+                                                                                                 n_rounds = self.n_rounds, 
+                                                                                                 current_talking_point = current_talking_point))
+
+        rounds_run = self.n_rounds
+        completed_rounds = 0
+        novelty_scores = []
+        try:
             for n in range(self.n_rounds):
 
-                print('\n')
-                print(f'===== Round {n+1} =====')
-                Debate_Talking_Point_History_For_Moderator +=  "\n" + f'===== Round {n+1} =====' + "\n"
-                print('\n')
-
-                # ask debater 1
-                print(f'Debater #1')
-                print('\n')
-                debater_1_response = self.DEBATER_1.ask()
-                Debate_Talking_Point_History_For_Moderator += "\n\n" + "Debater #1:\n" + debater_1_response
-                print('\n')
-
-                # add debater 1's response to both debater's memories
-                self.DEBATER_1.add_message_to_memory(role='user', message= "Here's the answer you gave: " + debater_1_response)
-                self.DEBATER_2.add_message_to_memory(role='user', message= "Here's what your opponent stated: " + debater_1_response + "\n Now it's your turn, remember what you are arguing for and against!\n")
-
-                # ask debater 2
-                print(f'Debater #2')
-                print('\n')
-                debater_2_response = self.DEBATER_2.ask()
-                Debate_Talking_Point_History_For_Moderator += "\n\n" + "Debater #2:\n" + debater_2_response
-                print('\n')
-
-                # add debater 2's response to both debater's memories
-
-                self.DEBATER_1.add_message_to_memory(role='user', message= "Here's what your opponent stated: " + debater_2_response + "\n Now it's your turn, remember what you are arguing for and against!\n")
-                self.DEBATER_2.add_message_to_memory(role='user', message= "Here's the answer you gave: " + debater_2_response)
-
-            # empty debater's memory before next talking point
-            self.DEBATER_1.empty_memory_for_next_talking_point()
-            self.DEBATER_2.empty_memory_for_next_talking_point()
-
-            # have moderator pick a winner for the current talking point
-            print(f'===== Moderator Evaluation for talking point: {current_talking_point} =====')
-            self.MODERATOR.add_message_to_memory(role='user', message=moderator_talking_point_eval_instruction.format(current_talking_point=current_talking_point, 
-                                                                                                                transcript = Debate_Talking_Point_History_For_Moderator))
-            moderator_eval_talking_point = self.MODERATOR.ask()
-            print('\n')
-            self.MODERATOR.add_message_to_memory(role='assistant', message=moderator_eval_talking_point)
-
-            # empty moderators's memory before next talking point
-            self.MODERATOR.empty_memory_for_moderator_for_next_talking_point_summary()
-
-            # append memory to global lists
-            self.summaries.append(f'Summary for {current_talking_point}: \n{moderator_eval_talking_point} \n\n')
-            self.debates_for_each_talking_point.append(f'Topic: {self.topic} \nCurrent talking point: {current_talking_point} \n\nDebate:\n{Debate_Talking_Point_History_For_Moderator} \n\n')
-
-            print('\n\n')
-
-        # now it's the master's turn to take all of the moderator's notes, summarize what had happened and pick a final champion
-        self.MASTER.add_message_to_memory(role='user', message=master_prompt_instruction_final_evalation.format(talking_points = self.moderator_talking_points,
-                                                                                                        moderator_notes = '\n'.join(self.summaries)))
-
-        print('\n')
-        print('Debate has now finished')
-        print('\n')
-        print(f"===== Master's Final Debate Champion Selection =====")
-        master_final_champion_selection = self.MASTER.ask()
-        self.MASTER.add_message_to_memory(role='assistant', message=master_final_champion_selection)
+                with self.span('round', round = n+1):
+                    self.emit_phase('round', talking_point = current_talking_point, round = n+1)
+
+                    # ask debater 1
+                    debater_1_response = await self.turn(DEBATER_1, f'round_{n+1}', talking_point = current_talking_point, round = n+1)
+
+                    # add debater 1's response to both debater's memories
+                    DEBATER_1.add_message_to_memory(role='user', message=debater_1_response, prefix="Here's the answer you gave: ")
+                    DEBATER_2.add_message_to_memory(role='user', message=debater_1_response, prefix="Here's what your opponent stated: ", suffix="\n Now it's your turn, remember what you are arguing for and against!\n")
+
+                    # ask debater 2
+                    debater_2_response = await self.turn(DEBATER_2, f'round_{n+1}', talking_point = current_talking_point, round = n+1)
+
+                    # add debater 2's response to both debater's memories
+
+                    DEBATER_1.add_message_to_memory(role='user', message=debater_2_response, prefix="Here's what your opponent stated: ", suffix="\n Now it's your turn, remember what you are arguing for and against!\n")
+                    DEBATER_2.add_message_to_memory(role='user', message=debater_2_response, prefix="Here's the answer you gave: ")
+                    completed_rounds = n+1
+
+                    # stop early once the debaters start repeating themselves
+                    if self.early_stopping is not None and n+1 < self.n_rounds:
+                        stop, score = await self.early_stopping.should_stop(self.transcript, current_talking_point, n+1, moderator=MODERATOR, ask=self.ask)
+                        if score is not None:
+                            novelty_scores.append(score)
+                        if stop:
+                            rounds_run = n+1
+                            self.emit_phase('converged', talking_point = current_talking_point, round = n+1)
+                            self.instant('converged', talking_point = current_talking_point, round = n+1, novelty = score)
+                            break
+
+        except SkipRemainingRounds:
+            # out of budget for debating, the moderator evaluates the rounds completed so far (not debater 1's unanswered turn)
+            rounds_run = completed_rounds
+
+        if self.early_stopping is not None:
+            self.record_early_stopping(current_talking_point, rounds_run, novelty_scores)
+
+        if rounds_run == 0:
+            # not even the first round was completed, there is nothing worth paying the moderator to evaluate
+            self.drop_talking_point(current_talking_point, DEBATER_1, DEBATER_2, MODERATOR)
+            return None
+
+        # empty debater's memory before next talking point
+        DEBATER_1.empty_memory_for_next_talking_point()
+        DEBATER_2.empty_memory_for_next_talking_point()
+
+        # have moderator pick a winner for the current talking point
+        self.emit_phase('moderator_evaluation', talking_point = current_talking_point)
+        MODERATOR.add_message_to_memory(role='user', message=moderator_talking_point_eval_instruction.format(current_talking_point=current_talking_point, 
+                                                                                                             transcript = self.transcript.render_rounds(current_talking_point, max_round = rounds_run)))
+        with self.span('moderator_evaluation'):
+            moderator_eval_talking_point = await self.turn(MODERATOR, 'moderator_eval', talking_point = current_talking_point)
+        MODERATOR.add_message_to_memory(role='assistant', message=moderator_eval_talking_point)
+
+        # empty moderators's memory before next talking point
+        MODERATOR.empty_memory_for_moderator_for_next_talking_point_summary()
+
+        for agent in [DEBATER_1, DEBATER_2, MODERATOR]:
+            agent.event_context.pop('talking_point', None)
+
+        self.transcript.finish_talking_point(current_talking_point)
+
+        return f'Summary for {current_talking_point}: \n{moderator_eval_talking_point.text} \n\n'
+
+    def record_early_stopping(self, current_talking_point, rounds_run, novelty_scores):
+
+        # skipped rounds would have cost at least as much as the last one that ran, their prompts only grow
+        last_round = [turn for turn in self.transcript.round_turns(current_talking_point) if turn.round == rounds_run]
+        last_round_tokens = sum((turn.prompt_tokens or 0) + (turn.completion_tokens or 0) for turn in last_round)
+
+        self.early_stopping_stats[current_talking_point] = {'rounds_run': rounds_run,
+                                                            'rounds_skipped': self.n_rounds - rounds_run,
+                                                            'novelty': novelty_scores,
+                                                            'tokens_saved_estimate': last_round_tokens * (self.n_rounds - rounds_run)}
+
+    def early_stopping_report(self):
+        stats = self.early_stopping_stats.values()
+        return {'rounds_run': sum(stat['rounds_run'] for stat in stats),
+                'rounds_skipped': sum(stat['rounds_skipped'] for stat in stats),
+                'tokens_saved_estimate': sum(stat['tokens_saved_estimate'] for stat in stats),
+                'by_talking_point': dict(self.early_stopping_stats)}
+
+    def debate_for_talking_point(self, current_talking_point):
+        return f'Topic: {self.topic} \nCurrent talking point: {current_talking_point} \n\nDebate:\n{self.transcript.render_rounds(current_talking_point)} \n\n'
+
+    @property
+    def debates_for_each_talking_point(self):
+        # rendered from the transcript on demand rather than held in memory
+        return [self.debate_for_talking_point(current_talking_point) for current_talking_point in self.moderator_talking_points_list]
+
+    def results(self):
+
+        results = {'topic': self.topic,
+                   'n_talking_points': self.n_talking_points,
+                   'n_rounds': self.n_rounds,
+                   'debater_1_instruction': self.debater_1_instruction,
+                   'debater_2_instruction': self.debater_2_instruction,
+                   'talking_points': self.moderator_talking_points_list,
+                   'summaries': self.summaries,
+                   'debates_for_each_talking_point': self.debates_for_each_talking_point,
+                   'master_final_champion_selection': self.master_final_champion_selection,
+                   'total_tokens': self.total_tokens(),
+                   'total_costs': self.total_costs(),
+                   'costs_by_deployment': self.costs_by_deployment(),
+                   'tokens_saved': self.tokens_saved(),
+                   'prompt_cache': self.prompt_cache_report(),
+                   'latency_by_phase': self.latency_summary(by='phase')}
+        if self.early_stopping is not None:
+            results['early_stopping'] = self.early_stopping_report()
+        if self.budgets:
+            results['budget'] = self.budget_report()
+        if self.batch is not None:
+            results['batched_calls'] = sum(1 for call in self.calls() if call['deployment'].endswith(BATCH_SUFFIX))
+        return results
+
+    def budget_report(self):
+        return {'mode': self.budget_mode,
+                'budgets': [budget.stats() for budget in self.budgets],
+                'degradations': list(self.budget_degradations),
+                'talking_points_skipped': len(self.moderator_talking_points_list) - len(self.summaries)}
+
+    def calls(self):
+        # every call of every player, tagged with this debate, in the order they were started
+        calls = [{'debate_id': self.debate_id, **call} for agent in self.players() for call in agent.calls_raw]
+        return sorted(calls, key=lambda call: call['started_at'])
+
+    def latency_summary(self, by = 'role'):
+        """p50/p95/p99 of latency, time to first token, tokens/sec and queueing per role (or phase, agent, deployment)."""
+        return summarize_calls(self.calls(), by=by)
+
+    def export_metrics(self, path, format = 'jsonl'):
+        if format == 'prometheus':
+            with open(path, 'w') as file:
+                file.write(to_prometheus(self.calls()))
+                if self.budgets:
+                    file.write(budgets_to_prometheus(self.budgets))
+        else:
+            export_calls_jsonl(self.calls(), path)
+
+    def prompt_cache_report(self):
+        # provider prompt cache hit ratio per role, both debaters counted together
+        report = {}
+        for role, agents in [('master', [self.MASTER]), ('moderator', [self.MODERATOR]), ('debater', [self.DEBATER_1, self.DEBATER_2])]:
+            prompt_tokens = sum(agent.get_prompt_cache_usage()['prompt_tokens'] for agent in agents)
+            cached_prompt_tokens = sum(agent.get_prompt_cache_usage()['cached_prompt_tokens'] for agent in agents)
+            report[role] = {'prompt_tokens': prompt_tokens, 'cached_prompt_tokens': cached_prompt_tokens,
+                            'hit_ratio': cached_prompt_tokens / prompt_tokens if prompt_tokens else 0.0}
+        return report
+
+    def tokens_saved(self):
+        # prompt tokens not sent thanks to memory compaction, per player
+        return {agent.name: agent.tokens_saved for agent in self.players()}
 
     def total_tokens(self):
 
@@ -161,4 +552,12 @@ class Debate:
         for d in [self.MASTER.get_cost_usage(), self.MODERATOR.get_cost_usage(), self.DEBATER_1.get_cost_usage(), self.DEBATER_2.get_cost_usage()]:
             c.update(d)
         total_cost_dict = dict(c)
-        return total_cost_dict
\ No newline at end of file
+        return total_cost_dict
+
+    def costs_by_deployment(self):
+
+        costs = {}
+        for agent in self.players():
+            for deployment_name, cost in agent.get_cost_by_deployment().items():
+                costs.setdefault(deployment_name, Counter()).update(cost)
+        return {deployment_name: dict(cost) for deployment_name, cost in costs.items()}
\ No newline at end of file
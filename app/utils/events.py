@@ -0,0 +1,154 @@
+import asyncio
+import json
+from dataclasses import dataclass, asdict
+
+@dataclass
+class Event:
+    debate_id: str = None
+    talking_point: str = None
+
+    @property
+    def type(self):
+        return type(self).__name__
+
+    def to_dict(self):
+        return {'type': self.type, **asdict(self)}
+
+@dataclass
+class PhaseEvent(Event):
+    """Debate moved to a new phase: assign_debater_1, assign_debater_2, set_talking_points, talking_point, round, moderator_evaluation, final_verdict, finished."""
+    phase: str = None
+    round: int = None
+
+@dataclass
+class TurnStartEvent(Event):
+    agent: str = None
+
+@dataclass
+class TokenEvent(Event):
+    agent: str = None
+    token: str = None
+
+@dataclass
+class TurnEndEvent(Event):
+    agent: str = None
+    response: str = None
+    usage: dict = None
+
+@dataclass
+class BudgetEvent(Event):
+    """A budget was charged for a call: its running totals against its limits (None: unlimited)."""
+    agent: str = None
+    budget: str = None
+    spent_tokens: int = None
+    spent_cost: float = None
+    max_tokens: int = None
+    max_cost: float = None
+
+class EventBus:
+    """Fans events out to subscribed callbacks; async consumers can iterate stream() instead."""
+
+    def __init__(self) -> None:
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def emit(self, event: Event):
+        for callback in self.subscribers:
+            callback(event)
+
+    async def stream(self, until = None):
+        """Yield events as they are emitted; stops after an event for which until(event) is true (e.g. a 'finished' phase)."""
+
+        queue = asyncio.Queue()
+        callback = self.subscribe(queue.put_nowait)
+        try:
+            while True:
+                event = await queue.get()
+                yield event
+                if until is not None and until(event):
+                    return
+        finally:
+            self.unsubscribe(callback)
+
+### SINKS ###
+
+SPEAKERS = {'debater_1': 'Debater #1', 'debater_2': 'Debater #2'}
+
+class ConsolePrinter:
+    """
+    Narrates a debate on stdout the way Debate used to print it.
+
+    With buffered=True every turn is printed in one piece when it ends, so concurrent turns and debates don't interleave token by token.
+    """
+
+    def __init__(self, buffered = False) -> None:
+        self.buffered = buffered
+        self.buffers = {}
+
+    def phase(self, event: PhaseEvent):
+
+        if event.phase == 'assign_debater_1':
+            return 'Debater #1 instructions given by Master'
+        if event.phase == 'assign_debater_2':
+            return '\n\nDebater #2 instructions given by Master'
+        if event.phase == 'set_talking_points':
+            return "\n\nModerator's talking points to construct debate"
+        if event.phase == 'talking_point':
+            return '*' * 100 + f'\nCurrent talking point: {event.talking_point}'
+        if event.phase == 'round':
+            return f'\n\n===== Round {event.round} =====\n\n'
+        if event.phase == 'moderator_evaluation':
+            return f'===== Moderator Evaluation for talking point: {event.talking_point} ====='
+        if event.phase == 'final_verdict':
+            return "\n\nDebate has now finished\n\n\n===== Master's Final Debate Champion Selection ====="
+        if event.phase.startswith('budget_'):
+            return f"\n\n===== Budget: {event.phase[len('budget_'):].replace('_', ' ')} =====\n"
+        return None
+
+    def __call__(self, event: Event):
+
+        if isinstance(event, PhaseEvent):
+            text = self.phase(event)
+            if text is not None:
+                print(text)
+
+        elif isinstance(event, TurnStartEvent):
+            # buffered, the speaker is announced together with the turn
+            if event.agent in SPEAKERS and not self.buffered:
+                print(f'{SPEAKERS[event.agent]}\n\n')
+
+        elif isinstance(event, TokenEvent):
+            if self.buffered:
+                self.buffers.setdefault((event.debate_id, event.talking_point, event.agent), []).append(event.token)
+            else:
+                print(event.token, end='')
+
+        elif isinstance(event, TurnEndEvent):
+            if self.buffered:
+                tokens = self.buffers.pop((event.debate_id, event.talking_point, event.agent), None)
+                header = f'{SPEAKERS[event.agent]}\n\n\n' if event.agent in SPEAKERS else ''
+                # calls that did not stream (e.g. batched ones) only have the response
+                print(header + (''.join(tokens) if tokens else event.response or ''), end='')
+            print('\n')
+
+class JsonlFileSink:
+    """Appends events to a JSONL file; token events are skipped unless include_tokens is set."""
+
+    def __init__(self, path: str, include_tokens = False) -> None:
+        self.file = open(path, 'a')
+        self.include_tokens = include_tokens
+
+    def __call__(self, event: Event):
+        if isinstance(event, TokenEvent) and not self.include_tokens:
+            return
+        self.file.write(json.dumps(event.to_dict()) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
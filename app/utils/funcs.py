@@ -1,13 +1,40 @@
-import tiktoken
-import openai
+import asyncio
+import functools
+import os
+import threading
 
-def num_tokens_from_messages(messages, model="gpt-4-turbo"):
-    """Return the number of tokens used by a list of messages."""
+def approx_num_tokens(text: str):
+    # ~4 characters per token, good enough for a stand-in that must not depend on tiktoken
+    return max(1, len(text) // 4)
+
+class ApproximateEncoding:
+    """Stand-in for a tiktoken encoding when none can be loaded; only the number of tokens encode() returns is meaningful."""
+
+    name = "approximate"
+
+    def encode(self, text):
+        return [0] * approx_num_tokens(text) if text else []
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model="gpt-4-turbo"):
+    """Return the tiktoken encoding for a model, loaded (and warned about) only once per model, on first use."""
+
+    # tiktoken is slow to import and its encodings to load, neither is needed until something is counted
     try:
-        encoding = tiktoken.encoding_for_model(model)
-    except KeyError:
-        print("Warning: model not found. Using cl100k_base encoding.")
-        encoding = tiktoken.get_encoding("cl100k_base")
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            print("Warning: model not found. Using cl100k_base encoding.")
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its encodings on first use; offline (e.g. a debate on the MockBackend) counts are approximated instead
+        print(f"Warning: tiktoken encoding unavailable ({type(e).__name__}). Approximating token counts.")
+        return ApproximateEncoding()
+
+@functools.lru_cache(maxsize=None)
+def get_message_overhead(model="gpt-4-turbo"):
+    """Return (tokens_per_message, tokens_per_name, model whose encoding to use) for a model."""
     if model in {
         "gpt-3.5-turbo-0613",
         "gpt-3.5-turbo-16k-0613",
@@ -17,38 +44,110 @@ def num_tokens_from_messages(messages, model="gpt-4-turbo"):
         "gpt-4-32k-0613",
         "gpt-4-turbo"
         }:
-        tokens_per_message = 3
-        tokens_per_name = 1
+        return 3, 1, model
     elif model == "gpt-3.5-turbo-0301":
-        tokens_per_message = 4  # every message follows <|start|>{role/name}\n{content}<|end|>\n
-        tokens_per_name = -1  # if there's a name, the role is omitted
+        return 4, -1, model  # every message follows <|start|>{role/name}\n{content}<|end|>\n, if there's a name the role is omitted
     elif "gpt-3.5-turbo" in model:
         print("Warning: gpt-3.5-turbo may update over time. Returning num tokens assuming gpt-3.5-turbo-0613.")
-        return num_tokens_from_messages(messages, model="gpt-3.5-turbo-0613")
+        return get_message_overhead("gpt-3.5-turbo-0613")
     elif "gpt-4" in model:
         print("Warning: gpt-4 may update over time. Returning num tokens assuming gpt-4-0613.")
-        return num_tokens_from_messages(messages, model="gpt-4-0613")
+        return get_message_overhead("gpt-4-0613")
     else:
         raise NotImplementedError(
             f"""num_tokens_from_messages() is not implemented for model {model}. See https://github.com/openai/openai-python/blob/main/chatml.md for information on how messages are converted to tokens."""
         )
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += len(encoding.encode(value))
-            if key == "name":
-                num_tokens += tokens_per_name
-    num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
+
+def num_tokens_from_text(text, model="gpt-4-turbo"):
+    """Return the number of tokens in a plain string."""
+    encoding = get_encoding(get_message_overhead(model)[2])
+    return len(encoding.encode(text))
+
+def num_tokens_from_message(message, model="gpt-4-turbo"):
+    """Return the number of tokens a single message adds to a prompt."""
+    tokens_per_message, tokens_per_name, encoding_model = get_message_overhead(model)
+    encoding = get_encoding(encoding_model)
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        num_tokens += len(encoding.encode(value))
+        if key == "name":
+            num_tokens += tokens_per_name
     return num_tokens
 
-def generate_response(messages, deployment_name, temperature = 0.0):
+REPLY_PRIMING_TOKENS = 3  # every reply is primed with <|start|>assistant<|message|>
+
+def num_tokens_from_messages(messages, model="gpt-4-turbo"):
+    """Return the number of tokens used by a list of messages."""
+    return sum(num_tokens_from_message(message, model) for message in messages) + REPLY_PRIMING_TOKENS
+
+def generate_response(messages, deployment_name = None, temperature = 0.0, client = None):
+    """Blocking single call through an utils.client.AzureOpenAIClient, the process-wide one by default."""
+
+    if client is None:
+        from utils.backends import get_default_backend
+        client = get_default_backend().client
 
-    completion = openai.ChatCompletion.create(
-        engine=deployment_name, 
-        messages=messages, 
+    completion = client.sync_client.chat.completions.create(
+        model=deployment_name or client.deployment_name,
+        messages=messages,
         temperature=temperature)
-    
-    response = completion.choices[0]['message']['content']
-    usage = completion.usage.to_dict()
-    return response, usage
\ No newline at end of file
+
+    response = completion.choices[0].message.content
+    usage = completion.usage.model_dump()
+    return response, usage
+
+_sync_loop = None
+_sync_loop_lock = threading.Lock()
+
+def get_sync_loop():
+    """The event loop run_sync runs coroutines on: one per process, kept running on a daemon thread."""
+
+    global _sync_loop
+    with _sync_loop_lock:
+        # a forked worker process inherits the loop object, but not the thread running it
+        if _sync_loop is None or _sync_loop.pid != os.getpid():
+            loop = asyncio.new_event_loop()
+            loop.pid = os.getpid()
+            loop.thread = threading.Thread(target=loop.run_forever, name='run_sync', daemon=True)
+            loop.thread.start()
+            _sync_loop = loop
+        return _sync_loop
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code, even if an event loop is already running (e.g. in a notebook).
+
+    Every call shares one persistent loop, so loop-bound resources (the client's connection pool, asyncio locks) are
+    created once and reused across sync calls instead of once per call and never closed.
+    """
+
+    loop = get_sync_loop()
+    if threading.current_thread() is loop.thread:
+        # called from a coroutine already running on that loop, which cannot wait for itself
+        return _run_on_new_thread(coro)
+
+    future = asyncio.run_coroutine_threadsafe(coro, loop)
+    try:
+        return future.result()
+    except BaseException:
+        # e.g. KeyboardInterrupt while waiting: don't leave the coroutine running in the background
+        future.cancel()
+        raise
+
+def _run_on_new_thread(coro):
+
+    result = {}
+
+    def runner():
+        try:
+            result['value'] = asyncio.run(coro)
+        except BaseException as e:
+            result['error'] = e
+
+    thread = threading.Thread(target=runner)
+    thread.start()
+    thread.join()
+
+    if 'error' in result:
+        raise result['error']
+    return result['value']
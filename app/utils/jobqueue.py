@@ -0,0 +1,234 @@
+from utils.tournament import Tournament
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+@dataclass
+class Job:
+    id: int
+    config: dict
+    attempts: int
+
+class JobQueue:
+    """
+    Interface of the debate job queue shared by producers and workers on any number of nodes.
+
+    A worker lease()s a job for lease_s seconds and must heartbeat() before the lease runs out; a job whose lease expired
+    (its worker died or hung) is redelivered to the next lease() call, up to max_attempts deliveries. complete() and fail()
+    only take effect while the caller still holds the lease, so a worker that lost its job cannot overwrite the new owner's result.
+    """
+
+    def enqueue(self, topic_configs):
+        raise NotImplementedError
+
+    def lease(self, worker_id: str, lease_s: float):
+        raise NotImplementedError
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_s: float):
+        raise NotImplementedError
+
+    def complete(self, job_id: int, worker_id: str, result: dict):
+        raise NotImplementedError
+
+    def fail(self, job_id: int, worker_id: str, error: str):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+    def results(self):
+        raise NotImplementedError
+
+class SQLiteJobQueue(JobQueue):
+    """
+    JobQueue in a SQLite file, the local stand-in for a message broker.
+
+    Leases are taken in IMMEDIATE transactions, so any number of worker processes can share the file on one host (or a
+    file system with working locks). Topic configs with an 'id' are enqueued once, re-enqueueing the same topics file is a no-op.
+    """
+
+    def __init__(self, path = 'jobs.sqlite', max_attempts = 3) -> None:
+
+        import sqlite3
+
+        self.path = path
+        self.max_attempts = max_attempts
+
+        self.lock = threading.Lock()
+        # autocommit, transactions are opened explicitly where reads and writes must be atomic
+        self.connection = sqlite3.connect(path, check_same_thread = False, isolation_level = None, timeout = 30.0)
+        self.connection.execute('PRAGMA journal_mode = WAL')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, config TEXT,
+                                   status TEXT, worker TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0, result TEXT, error TEXT,
+                                   enqueued_at REAL, finished_at REAL)''')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)')
+
+    def enqueue(self, topic_configs):
+
+        now = time.time()
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.execute('BEGIN IMMEDIATE')
+            self.connection.executemany("INSERT OR IGNORE INTO jobs (key, config, status, enqueued_at) VALUES (?, ?, 'queued', ?)",
+                                        [(str(topic_config['id']) if 'id' in topic_config else None, json.dumps(topic_config), now) for topic_config in topic_configs])
+            self.connection.execute('COMMIT')
+            return self.connection.total_changes - before
+
+    def lease(self, worker_id: str, lease_s: float):
+
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                # expired leases are redelivered, unless the job has had all its attempts
+                self.connection.execute("UPDATE jobs SET status = 'failed', error = 'lease expired after the last attempt', finished_at = ? "
+                                        "WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+                row = self.connection.execute("SELECT id, config, attempts FROM jobs WHERE status = 'queued' OR (status = 'leased' AND lease_expires < ?) "
+                                              "ORDER BY id LIMIT 1", (now,)).fetchone()
+                if row is not None:
+                    self.connection.execute("UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                                            (worker_id, now + lease_s, row[0]))
+                self.connection.execute('COMMIT')
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+
+        if row is None:
+            return None
+        return Job(id = row[0], config = json.loads(row[1]), attempts = row[2] + 1)
+
+    def update_leased(self, job_id: int, worker_id: str, assignments: str, values = ()):
+        # only the current lease holder may change a job
+        with self.lock:
+            cursor = self.connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND worker = ? AND status = 'leased'", (*values, job_id, worker_id))
+            return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_s: float):
+        return self.update_leased(job_id, worker_id, 'lease_expires = ?', (time.time() + lease_s,))
+
+    def complete(self, job_id: int, worker_id: str, result: dict):
+        return self.update_leased(job_id, worker_id, "status = 'done', result = ?, finished_at = ?", (json.dumps(result), time.time()))
+
+    def fail(self, job_id: int, worker_id: str, error: str):
+        """Requeue the job for another attempt, or fail it for good after max_attempts; returns the job's new status (None if the lease was lost)."""
+        with self.lock:
+            row = self.connection.execute('SELECT attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        status = 'failed' if row is not None and row[0] >= self.max_attempts else 'queued'
+        if self.update_leased(job_id, worker_id, 'status = ?, error = ?, finished_at = ?', (status, error, time.time() if status == 'failed' else None)):
+            return status
+        return None
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.connection.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+            expired = self.connection.execute("SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_expires < ?", (time.time(),)).fetchone()[0]
+            redelivered = self.connection.execute('SELECT COUNT(*) FROM jobs WHERE attempts > 1').fetchone()[0]
+        return {**{status: counts.get(status, 0) for status in ['queued', 'leased', 'done', 'failed']}, 'expired_leases': expired, 'redelivered': redelivered}
+
+    def results(self):
+        """Results of finished jobs, failed ones as {'id', 'topic', 'error'} like Tournament writes them (jobs without an id go by the job's)."""
+        with self.lock:
+            rows = self.connection.execute("SELECT id, config, status, result, error FROM jobs WHERE status IN ('done', 'failed') ORDER BY id").fetchall()
+        for job_id, config, status, result, error in rows:
+            if status == 'done':
+                yield json.loads(result)
+            else:
+                config = json.loads(config)
+                yield {'id': config.get('id', job_id), 'topic': config.get('topic'), 'error': error}
+
+    def pending(self):
+        # jobs that some worker may still run: queued, or leased (and possibly about to be redelivered)
+        stats = self.stats()
+        return stats['queued'] + stats['leased']
+
+class QueueWorker:
+    """
+    Runs debate jobs leased from a JobQueue through a Tournament, up to the tournament's max_concurrency at a time.
+
+    Each running job is heartbeated every lease_s / 3 seconds; if the lease is lost anyway the debate is cancelled and its
+    result dropped. Give the tournament a checkpoint_dir on shared storage and a redelivered job resumes where its dead worker
+    stopped instead of starting over. With exit_when_empty the worker stops once no job is queued or leased anywhere.
+    """
+
+    def __init__(self, queue: JobQueue, tournament: Tournament, worker_id = None, lease_s = 120.0, poll_interval_s = 5.0, exit_when_empty = True) -> None:
+
+        self.queue = queue
+        self.tournament = tournament
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+        self.lease_s = lease_s
+        self.poll_interval_s = poll_interval_s
+        self.exit_when_empty = exit_when_empty
+
+        self.n_jobs = 0
+        self.n_requeued = 0
+        self.n_leases_lost = 0
+
+    async def run_async(self):
+
+        self.tournament.start = time.perf_counter()
+        await asyncio.gather(*[self.slot() for _ in range(self.tournament.max_concurrency)])
+        self.tournament.elapsed = time.perf_counter() - self.tournament.start
+        return {**self.tournament.report(), 'worker': self.stats()}
+
+    def run(self):
+        from utils.funcs import run_sync
+        return run_sync(self.run_async())
+
+    async def slot(self):
+
+        while True:
+            job = self.queue.lease(self.worker_id, self.lease_s)
+            if job is not None:
+                await self.run_job(job)
+            elif self.exit_when_empty and not self.queue.pending():
+                return
+            else:
+                await asyncio.sleep(self.poll_interval_s)
+
+    async def run_job(self, job: Job):
+
+        self.n_jobs += 1
+        # jobs without an id are named after the job, so transcripts and checkpoints stay unique across nodes
+        topic_config = {'id': job.id, **job.config}
+
+        debate = asyncio.ensure_future(self.tournament.run_debate_async(topic_config))
+        heartbeat = asyncio.ensure_future(self.heartbeat(job, debate))
+        try:
+            result = await debate
+        except asyncio.CancelledError:
+            if not heartbeat.done():
+                raise
+            # the lease went to another worker, which owns the job now
+            self.n_leases_lost += 1
+            return
+        except Exception as e:
+            status = self.queue.fail(job.id, self.worker_id, repr(e))
+            if status == 'queued':
+                self.n_requeued += 1
+            elif status == 'failed':
+                self.tournament.write_result(self.tournament.failed(topic_config, e))
+            return
+        finally:
+            heartbeat.cancel()
+
+        if self.queue.complete(job.id, self.worker_id, result):
+            self.tournament.tally(result)
+            self.tournament.write_result(result)
+        else:
+            self.n_leases_lost += 1
+
+    async def heartbeat(self, job: Job, debate: asyncio.Future):
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            if not self.queue.heartbeat(job.id, self.worker_id, self.lease_s):
+                debate.cancel()
+                return
+
+    def stats(self):
+        return {'worker_id': self.worker_id, 'n_jobs': self.n_jobs, 'n_requeued': self.n_requeued, 'n_leases_lost': self.n_leases_lost}
@@ -0,0 +1,89 @@
+from utils.prompts import compaction_summary_system_message, compaction_summary_instruction, compaction_summary_message
+from utils.funcs import num_tokens_from_text
+
+class CompactionStrategy:
+    """
+    Keeps an agent's prompt under `max_prompt_tokens` by compacting its older turns.
+
+    The agent's first `n_pinned_messages` (system prompt and task instruction) and the `keep_last` most recent
+    messages are never touched; subclasses decide what happens to the messages in between.
+    """
+
+    def __init__(self, max_prompt_tokens: int, keep_last = 2) -> None:
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_last = keep_last
+
+    def compactable_range(self, agent):
+        """Return the (start, end) slice of agent.messages that may be compacted, oldest first."""
+        start = agent.n_pinned_messages
+        end = max(start, len(agent.memory) - self.keep_last)
+        return start, end
+
+    def messages_to_compact(self, agent):
+        # drop the oldest compactable messages until the remaining prompt would fit the budget
+        start, end = self.compactable_range(agent)
+        excess = agent.prompt_tokens - self.max_prompt_tokens
+
+        stop = start
+        while stop < end and excess > 0:
+            excess -= agent.message_tokens[stop]
+            stop += 1
+        return start, stop
+
+    async def compact(self, agent):
+        """Compact agent's memory if it is over budget; returns the number of prompt tokens removed."""
+        if agent.prompt_tokens <= self.max_prompt_tokens:
+            return 0
+
+        start, stop = self.messages_to_compact(agent)
+        if stop == start:
+            return 0
+
+        before = agent.prompt_tokens
+        await self.replace(agent, start, stop)
+        return before - agent.prompt_tokens
+
+    async def replace(self, agent, start: int, stop: int):
+        raise NotImplementedError
+
+    def projected_call_tokens(self, agent):
+        """(prompt, completion) tokens of the calls compact() would issue before agent's next ask, for the budget check."""
+        return 0, 0
+
+class DropMiddle(CompactionStrategy):
+    """Forget the oldest unpinned turns outright."""
+
+    async def replace(self, agent, start: int, stop: int):
+        agent.replace_messages(start, stop, [])
+
+class SummarizeMiddle(CompactionStrategy):
+    """Replace the oldest unpinned turns with a short summary written by the agent's own backend."""
+
+    def __init__(self, max_prompt_tokens: int, keep_last = 2, deployment_name = None) -> None:
+        super().__init__(max_prompt_tokens, keep_last)
+        self.deployment_name = deployment_name
+
+    def messages_to_compact(self, agent):
+        # the summary itself takes room, so always fold the whole compactable range into it
+        return self.compactable_range(agent)
+
+    def projected_call_tokens(self, agent):
+        if agent.prompt_tokens <= self.max_prompt_tokens:
+            return 0, 0
+        start, stop = self.messages_to_compact(agent)
+        if stop == start:
+            return 0, 0
+        instructions = compaction_summary_system_message + compaction_summary_instruction
+        return sum(agent.message_tokens[start:stop]) + num_tokens_from_text(instructions, agent.token_model), agent.expected_completion_tokens()
+
+    async def replace(self, agent, start: int, stop: int):
+
+        transcript = '\n\n'.join(entry.content for entry in agent.memory[start:stop])
+        messages = [{'role': 'system', 'content': compaction_summary_system_message},
+                    {'role': 'user', 'content': compaction_summary_instruction.format(transcript = transcript)}]
+
+        # an ordinary call of the agent's, under its retry policy, circuit breaker and rate limiter, recorded and priced like any other
+        summary = await agent.generate_response_async(messages, deployment_name = self.deployment_name or agent.deployment_for('compaction'),
+                                                      call = agent.start_call('compaction'))
+
+        agent.replace_messages(start, stop, [{'role': 'user', 'content': compaction_summary_message.format(summary = summary)}])
@@ -0,0 +1,83 @@
+import json
+import math
+
+# per-call timings recorded by Agent in calls_raw
+LATENCY_FIELDS = ['latency_s', 'ttft_s', 'tokens_per_sec', 'queue_s']
+
+def percentile(values: "list[float]", q: float):
+    """Linearly interpolated q-th percentile (0-100) of values."""
+    values = sorted(values)
+    if not values:
+        return None
+    k = (len(values) - 1) * q / 100
+    lower, upper = math.floor(k), math.ceil(k)
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+def summarize(values: "list[float]"):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {'mean': sum(values) / len(values), 'p50': percentile(values, 50), 'p95': percentile(values, 95), 'p99': percentile(values, 99), 'max': max(values)}
+
+def summarize_calls(calls: "list[dict]", by = 'role', fields = LATENCY_FIELDS):
+    """Group call records by `by` (role, phase, agent, deployment, ...) and summarize each latency field."""
+
+    groups = {}
+    for call in calls:
+        groups.setdefault(call.get(by), []).append(call)
+
+    summary = {}
+    for group, group_calls in groups.items():
+        summary[group] = {'n_calls': len(group_calls),
+                          'total_latency_s': sum(call['latency_s'] for call in group_calls),
+                          'retries': sum(call.get('retries', 0) for call in group_calls)}
+        for field in fields:
+            summary[group][field] = summarize([call.get(field) for call in group_calls])
+    return summary
+
+def export_calls_jsonl(calls: "list[dict]", path: str):
+    with open(path, 'a') as file:
+        for call in calls:
+            file.write(json.dumps(call) + '\n')
+
+def to_prometheus(calls: "list[dict]", by = ('role', 'phase'), prefix = 'llm_debate'):
+    """Render call latencies as Prometheus text-format summaries, labelled by the `by` fields."""
+
+    groups = {}
+    for call in calls:
+        groups.setdefault(tuple(call.get(label) for label in by), []).append(call)
+
+    lines = []
+    for field in LATENCY_FIELDS:
+        name = f'{prefix}_{field}'
+        lines.append(f'# TYPE {name} summary')
+        for key, group_calls in groups.items():
+            values = [call[field] for call in group_calls if call.get(field) is not None]
+            if not values:
+                continue
+            labels = ','.join(f'{label}="{value}"' for label, value in zip(by, key))
+            for q in [0.5, 0.95, 0.99]:
+                lines.append(f'{name}{{{labels},quantile="{q}"}} {percentile(values, q * 100)}')
+            lines.append(f'{name}_sum{{{labels}}} {sum(values)}')
+            lines.append(f'{name}_count{{{labels}}} {len(values)}')
+
+    lines.append(f'# TYPE {prefix}_retries_total counter')
+    for key, group_calls in groups.items():
+        labels = ','.join(f'{label}="{value}"' for label, value in zip(by, key))
+        lines.append(f'{prefix}_retries_total{{{labels}}} {sum(call.get("retries", 0) for call in group_calls)}')
+
+    return '\n'.join(lines) + '\n'
+
+def budgets_to_prometheus(budgets, prefix = 'llm_debate'):
+    """Render utils.budget.Budget consumption and limits as Prometheus gauges, labelled by budget name."""
+
+    lines = []
+    for field, unit in [('tokens', 'tokens'), ('cost', 'eur')]:
+        for kind in ['spent', 'max']:
+            name = f'{prefix}_budget_{kind}_{unit}'
+            lines.append(f'# TYPE {name} gauge')
+            for budget in budgets:
+                value = getattr(budget, f'{kind}_{field}')
+                if value is not None:
+                    lines.append(f'{name}{{budget="{budget.name}"}} {value}')
+    return '\n'.join(lines) + '\n'
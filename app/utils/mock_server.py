@@ -0,0 +1,129 @@
+"""
+HTTP stand-in for an Azure OpenAI deployment, backed by MockBackend.
+
+    python -m utils.mock_server --port 8000 --latency 0.5 --tokens-per-second 50 --error-rate 0.05
+
+serves POST /openai/deployments/<deployment>/chat/completions (and /v1/chat/completions) with both plain and
+`stream: true` (server-sent events) responses, so the real client code path can be exercised without Azure quota.
+"""
+
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.backends import BackendError, MockBackend, provider_usage
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+
+    backend: MockBackend = None
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict, headers = None):
+
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+
+        match = re.match(r'^/openai/deployments/([^/]+)/chat/completions|^/v1/chat/completions', self.path)
+        if match is None:
+            return self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        deployment_name = match.group(1) or request.get('model')
+        messages = request['messages']
+        temperature = request.get('temperature', 1.0)
+
+        try:
+            # the backend's call counter drives error injection, keep it consistent across handler threads
+            with self.lock:
+                self.backend.maybe_fail()
+                chunks, usage = self.backend.complete(messages, deployment_name, temperature, request.get('max_tokens'))
+            # reported like the real API does, prompt cache hits included
+            usage = provider_usage(usage)
+        except BackendError as e:
+            return self.send_json(e.status_code or 500, {'error': {'message': str(e), 'code': str(e.status_code)}},
+                                  headers = {'Retry-After': str(e.retry_after)} if e.retry_after is not None else None)
+
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+
+        if request.get('stream'):
+            return self.stream(chunks, usage, deployment_name)
+
+        if self.backend.tokens_per_second:
+            time.sleep(len(chunks) / self.backend.tokens_per_second)
+
+        self.send_json(200, {'id': 'chatcmpl-mock',
+                             'object': 'chat.completion',
+                             'model': deployment_name,
+                             'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': ''.join(chunks)}}],
+                             'usage': usage})
+
+    def stream(self, chunks: "list[str]", usage: dict, deployment_name: str):
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.end_headers()
+
+        def event(delta, finish_reason = None, **extra):
+            payload = {'id': 'chatcmpl-mock', 'object': 'chat.completion.chunk', 'model': deployment_name,
+                       'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}], **extra}
+            self.wfile.write(f'data: {json.dumps(payload)}\n\n'.encode())
+            self.wfile.flush()
+
+        event({'role': 'assistant'})
+        for chunk in chunks:
+            if self.backend.tokens_per_second:
+                time.sleep(1 / self.backend.tokens_per_second)
+            event({'content': chunk})
+        event({}, finish_reason = 'stop', usage = usage)
+
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+
+def serve(backend: MockBackend, host = '127.0.0.1', port = 8000):
+    """Start the mock server in a background thread and return it; call .shutdown() to stop."""
+
+    handler = type('BoundMockRequestHandler', (MockRequestHandler,), {'backend': backend, 'lock': threading.Lock()})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Deterministic mock Azure OpenAI chat completions server.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8000)
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds before the first token')
+    parser.add_argument('--tokens-per-second', type = float, default = None)
+    parser.add_argument('--response-tokens', type = int, default = 64)
+    parser.add_argument('--error-rate', type = float, default = 0.0)
+    parser.add_argument('--error-status-code', type = int, default = 429)
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    backend = MockBackend(latency = args.latency, tokens_per_second = args.tokens_per_second, response_tokens = args.response_tokens,
+                          error_rate = args.error_rate, error_status_code = args.error_status_code, seed = args.seed)
+    server = serve(backend, args.host, args.port)
+    print(f'Mock chat completions server listening on http://{args.host}:{args.port}')
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -97,4 +97,32 @@ You'll debate about this aspect for {n_rounds} rounds, meaning {n_rounds} back a
 You do not need to address the audience or the moderator over and over. Focus on being concise, as long answers will lose the attention of the audience and the moderator. Make your arguments short and to-the-point. You can confront your opponent by asking them challenging questions, however you do not need to do so. If you're asked a question by your opponent, try not to dodge it. Remember, this is a conversation, not a speech.
 
 Debater #1 had started the discussion, as debater #2, you are to respond and make your own arguments.
-"""
\ No newline at end of file
+"""
+
+### MEMORY COMPACTION ###
+
+compaction_summary_system_message = "You are part of an AI simulation. In this world different AIs debate one another. You keep the participants' notes short."
+
+compaction_summary_instruction = """
+Here's an earlier part of a debate as seen by one of its participants:
+{transcript}
+
+Summarize it in a few sentences, keeping every distinct argument, question and commitment that was made, and who made it.
+
+Summary:
+"""
+
+compaction_summary_message = "Here's a summary of the earlier part of the discussion: {summary}"
+
+### CONVERGENCE CHECK ###
+
+convergence_check_system_message = "You are part of an AI simulation. In this world different AIs debate one another. You are the moderator of the debates."
+
+convergence_check_instruction = """
+The current aspect of the debate is: {current_talking_point}.
+
+Here's the transcript of the debate so far:
+{transcript}
+
+Did the latest round bring up any new argument, evidence or question, or are the debaters repeating themselves? Answer with a single word: NEW or REPEATING.
+"""
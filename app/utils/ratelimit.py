@@ -0,0 +1,166 @@
+import asyncio
+import fcntl
+import json
+import time
+from collections import OrderedDict, deque
+
+class LocalBucketStore:
+    """Token and request buckets held in this process."""
+
+    def __init__(self, tokens: float, requests: float) -> None:
+        self.state = {'tokens': tokens, 'requests': requests, 'updated': time.monotonic()}
+
+    def update(self, change):
+        # change(state, now) mutates the state and returns its result
+        return change(self.state, time.monotonic())
+
+class FileBucketStore:
+    """Token and request buckets kept in a small JSON file guarded by flock, shared by every process on the host."""
+
+    def __init__(self, path: str, tokens: float, requests: float) -> None:
+        self.path = path
+        self.initial = {'tokens': tokens, 'requests': requests}
+
+    def update(self, change):
+
+        with open(self.path, 'a+') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                file.seek(0)
+                content = file.read()
+                state = json.loads(content) if content else {**self.initial, 'updated': time.time()}
+
+                result = change(state, time.time())
+
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps(state))
+                # visible to the other processes once flushed; the buckets refill within seconds, so no fsync on the event loop
+                file.flush()
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+        return result
+
+class Reservation:
+
+    __slots__ = ('tokens', 'key')
+
+    def __init__(self, tokens: int, key) -> None:
+        self.tokens = tokens
+        self.key = key
+
+class RateLimiter:
+    """
+    Client-side token bucket for a deployment's tokens-per-minute and requests-per-minute quotas.
+
+    Callers acquire() an estimate of the call's tokens before sending it and reconcile() with the actual usage afterwards.
+    Waiting callers are served round robin across keys (one key per debate), so one busy debate can't starve the others.
+    Share one instance between every agent and debate that uses the deployment; pass path to also share it across processes.
+    Buckets hold `burst_seconds` worth of quota, matching how providers enforce per-minute limits over short windows.
+    """
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int, expected_completion_tokens = 500, burst_seconds = 10, path = None) -> None:
+
+        self.tokens_per_second = tokens_per_minute / 60
+        self.requests_per_second = requests_per_minute / 60
+        self.token_capacity = self.tokens_per_second * burst_seconds
+        self.request_capacity = max(1.0, self.requests_per_second * burst_seconds)
+        self.expected_completion_tokens = expected_completion_tokens
+
+        if path is None:
+            self.store = LocalBucketStore(self.token_capacity, self.request_capacity)
+        else:
+            self.store = FileBucketStore(path, self.token_capacity, self.request_capacity)
+
+        self.queues = OrderedDict()
+        self.wakeups = {}
+        self.wait_s = 0.0
+        self.n_acquired = 0
+
+    def refill(self, state, now):
+        elapsed = max(0.0, now - state['updated'])
+        state['tokens'] = min(self.token_capacity, state['tokens'] + elapsed * self.tokens_per_second)
+        state['requests'] = min(self.request_capacity, state['requests'] + elapsed * self.requests_per_second)
+        state['updated'] = now
+
+    def try_take(self, tokens: int):
+        """Take tokens and one request if both buckets allow it; otherwise return how long to wait."""
+
+        def change(state, now):
+            self.refill(state, now)
+            token_deficit = tokens - state['tokens']
+            request_deficit = 1 - state['requests']
+            if token_deficit <= 0 and request_deficit <= 0:
+                state['tokens'] -= tokens
+                state['requests'] -= 1
+                return 0.0
+            return max(token_deficit / self.tokens_per_second, request_deficit / self.requests_per_second)
+
+        return self.store.update(change)
+
+    def is_next(self, reservation):
+        if not self.queues:
+            return False
+        key, queue = next(iter(self.queues.items()))
+        return key == reservation.key and queue[0] is reservation
+
+    def wake_next(self):
+        if self.queues:
+            key, queue = next(iter(self.queues.items()))
+            wakeup = self.wakeups.get(queue[0])
+            if wakeup is not None:
+                wakeup.set()
+
+    async def acquire(self, estimated_tokens: int, key = None):
+        """Wait until the call fits the quota; returns a Reservation to reconcile() once the actual usage is known."""
+
+        # a single call can never need more than a full bucket
+        reservation = Reservation(min(int(estimated_tokens), int(self.token_capacity)), key)
+        self.queues.setdefault(key, deque()).append(reservation)
+        wakeup = self.wakeups[reservation] = asyncio.Event()
+        start = time.monotonic()
+
+        try:
+            while True:
+                if not self.is_next(reservation):
+                    await wakeup.wait()
+                    wakeup.clear()
+                    continue
+
+                delay = self.try_take(reservation.tokens)
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            self.release_turn(reservation)
+
+        self.wait_s += time.monotonic() - start
+        self.n_acquired += 1
+        return reservation
+
+    def release_turn(self, reservation):
+
+        queue = self.queues.get(reservation.key)
+        if queue is not None and reservation in queue:
+            was_next = self.is_next(reservation)
+            queue.remove(reservation)
+            if not queue:
+                del self.queues[reservation.key]
+            elif was_next:
+                # round robin: this key goes to the back of the line
+                self.queues.move_to_end(reservation.key)
+        self.wakeups.pop(reservation, None)
+        self.wake_next()
+
+    def reconcile(self, reservation, actual_tokens: int):
+        """Correct the token bucket by the difference between the estimate and what the call really used."""
+
+        def change(state, now):
+            self.refill(state, now)
+            state['tokens'] -= actual_tokens - reservation.tokens
+
+        self.store.update(change)
+
+    def stats(self):
+        return {'n_acquired': self.n_acquired, 'wait_s': self.wait_s, 'n_waiting': sum(len(queue) for queue in self.queues.values())}
@@ -0,0 +1,89 @@
+import asyncio
+import random
+import time
+
+from utils.backends import BackendError
+
+class CircuitOpenError(BackendError):
+    """Raised without calling the backend while the circuit breaker is open; retry_after is the time until it half-opens."""
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for transient backend failures.
+
+    A Retry-After hint from the provider takes precedence over the computed backoff.
+    """
+
+    RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+    def __init__(self, max_retries = 5, base_delay = 1.0, max_delay = 60.0, jitter = True) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+
+    def is_retryable(self, error: Exception):
+        if isinstance(error, BackendError):
+            # no status means the connection itself failed
+            return error.status_code is None or error.status_code in self.RETRYABLE_STATUS_CODES
+        return isinstance(error, (asyncio.TimeoutError, ConnectionError))
+
+    def should_retry(self, error: Exception, attempt: int):
+        return attempt < self.max_retries and self.is_retryable(error)
+
+    def delay(self, attempt: int, error: Exception = None):
+        retry_after = getattr(error, 'retry_after', None)
+        if retry_after is not None:
+            return min(float(retry_after), self.max_delay)
+
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return random.uniform(0, delay) if self.jitter else delay
+
+class CircuitBreaker:
+    """
+    Sheds load from a failing deployment: after `failure_threshold` consecutive failures calls are refused for
+    `reset_timeout` seconds, then a single trial call decides whether to close the circuit again.
+    Share one instance between every agent that talks to the same deployment.
+    """
+
+    def __init__(self, failure_threshold = 5, reset_timeout = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self.n_rejected = 0
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not go out; returns True if it goes out as the trial call."""
+
+        if self.state == 'open':
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                self.n_rejected += 1
+                raise CircuitOpenError('Circuit breaker is open, deployment is failing', retry_after = remaining)
+            self.state = 'half_open'
+            return True
+
+        elif self.state == 'half_open':
+            # a trial call is already in flight
+            self.n_rejected += 1
+            raise CircuitOpenError('Circuit breaker is half open, waiting for the trial call', retry_after = self.reset_timeout / 10)
+
+        return False
+
+    def release_trial(self):
+        # the trial call was cancelled before it decided anything; back to open with the timeout already passed, so the next call is the trial
+        if self.state == 'half_open':
+            self.state = 'open'
+
+    def record_success(self):
+        self.state = 'closed'
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == 'half_open' or self.failures >= self.failure_threshold:
+            self.state = 'open'
+            self.opened_at = time.monotonic()
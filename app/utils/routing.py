@@ -0,0 +1,26 @@
+class Router:
+    """
+    Picks the deployment for each call from the calling agent's role and the debate phase.
+
+    `routes` maps 'role:phase', a phase (e.g. 'moderator_eval', 'final_verdict') or a role (e.g. 'debater') to a deployment;
+    the most specific match wins and anything unmatched goes to `default` (None: the backend's own deployment).
+    `fallbacks` maps a deployment to the one to cascade to when a call on it still fails after its retries.
+    """
+
+    def __init__(self, routes = None, default = None, fallbacks = None) -> None:
+        self.routes = routes or {}
+        self.default = default
+        self.fallbacks = fallbacks or {}
+
+    def deployment(self, role, phase = None):
+        for key in [f'{role}:{phase}', phase, role]:
+            if key in self.routes:
+                return self.routes[key]
+        return self.default
+
+    def fallback(self, deployment_name):
+        return self.fallbacks.get(deployment_name)
+
+def parse_routes(routes: "list[str]"):
+    """Turn ['debater=gpt-35-turbo', 'final_verdict=gpt-4o'] into a routes dict."""
+    return dict(route.split('=', 1) for route in routes)
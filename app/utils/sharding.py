@@ -0,0 +1,108 @@
+from utils.tournament import read_topic_configs
+from utils.metrics import summarize_calls, export_calls_jsonl
+from utils.tracing import merge_traces
+
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+def shard_topic_configs(topic_configs, shard: int, n_shards: int):
+    """Every n_shards-th topic config from `shard` on; configs without an id get their position in the full list, so ids stay unique across shards."""
+    for index, topic_config in enumerate(topic_configs):
+        if index % n_shards == shard:
+            yield {'id': index, **topic_config}
+
+def shard_paths(shard_dir: str, shard: int):
+    paths = {name: os.path.join(shard_dir, f'shard-{shard}.{name}.jsonl') for name in ['results', 'calls', 'report']}
+    paths['trace'] = os.path.join(shard_dir, f'shard-{shard}.trace.json')
+    return paths
+
+def run_shard(make_tournament, topics_path: str, shard: int, n_shards: int, shard_dir: str):
+    """Worker process: run one shard of the topics file as a Tournament on its own event loop, writing its results, calls and report to shard_dir."""
+
+    paths = shard_paths(shard_dir, shard)
+    # a rerun starts the shard's files afresh, Tournament appends to its output
+    open(paths['results'], 'w').close()
+
+    tournament = make_tournament()
+    tournament.output_path = paths['results']
+    report = tournament.run(shard_topic_configs(read_topic_configs(topics_path), shard, n_shards))
+
+    export_calls_jsonl(tournament.calls, paths['calls'])
+    if tournament.debate_kwargs.get('tracer') is not None:
+        tournament.debate_kwargs['tracer'].save(paths['trace'])
+    with open(paths['report'], 'w') as file:
+        file.write(json.dumps(report) + '\n')
+    return paths
+
+def read_jsonl(path: str):
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def run_sharded(make_tournament, topics_path: str, n_shards: int, output_path: str, shard_dir = None, trace_path = None):
+    """
+    Shard a topics file across n_shards worker processes, each running the Tournament `make_tournament()` builds (a picklable
+    callable, e.g. a functools.partial of a module level function), then merge the per-shard result files into output_path
+    and return one aggregated report. Traces of tournaments built with a tracer are merged into trace_path.
+
+    Shards share nothing in memory: anything that must be shared across the run (rate limiter, response cache) has to be file backed.
+    """
+
+    shard_dir = shard_dir or f'{output_path}.shards'
+    os.makedirs(shard_dir, exist_ok = True)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers = n_shards) as pool:
+        futures = [pool.submit(run_shard, make_tournament, topics_path, shard, n_shards, shard_dir) for shard in range(n_shards)]
+        paths = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    with open(output_path, 'a') as output:
+        for shard_path in paths:
+            with open(shard_path['results'], 'r') as file:
+                for line in file:
+                    output.write(line)
+
+    if trace_path is not None:
+        merge_traces([shard_path['trace'] for shard_path in paths], trace_path)
+
+    reports = [read_jsonl(shard_path['report'])[0] for shard_path in paths]
+    calls = [call for shard_path in paths for call in read_jsonl(shard_path['calls'])]
+    return merge_reports(reports, calls, elapsed)
+
+def merge_reports(reports: "list[dict]", calls: "list[dict]", elapsed: float):
+    """One report over all shards, in the shape of Tournament.report(); latency percentiles are recomputed from the shards' calls."""
+
+    tokens, costs, early_stopping, degradations, batch = Counter(), Counter(), Counter(), Counter(), Counter()
+    prompt_cache = {}
+    for report in reports:
+        tokens.update(report['total_tokens'])
+        costs.update(report['total_costs'])
+        early_stopping.update(report['early_stopping'])
+        degradations.update(report['budget']['degradations'])
+        if report['batch'] is not None:
+            batch.update({key: report['batch'][key] for key in ['n_requests', 'n_batches', 'n_failed']})
+        for role, usage in report['prompt_cache'].items():
+            prompt_cache.setdefault(role, Counter()).update({'prompt_tokens': usage['prompt_tokens'], 'cached_prompt_tokens': usage['cached_prompt_tokens']})
+
+    n_completed = sum(report['n_completed'] for report in reports)
+    return {'n_shards': len(reports),
+            'n_debates': sum(report['n_debates'] for report in reports),
+            'n_completed': n_completed,
+            'n_failed': sum(report['n_failed'] for report in reports),
+            'elapsed_seconds': elapsed,
+            'debates_per_hour': n_completed / elapsed * 3600 if elapsed else 0.0,
+            'tokens_per_sec': tokens.get('total_tokens', 0) / elapsed if elapsed else 0.0,
+            'total_tokens': dict(tokens),
+            'total_costs': dict(costs),
+            'prompt_cache': {role: {**usage, 'hit_ratio': usage['cached_prompt_tokens'] / usage['prompt_tokens'] if usage['prompt_tokens'] else 0.0}
+                             for role, usage in prompt_cache.items()},
+            'latency_by_role': summarize_calls(calls, by='role'),
+            'latency_by_phase': summarize_calls(calls, by='phase'),
+            'early_stopping': dict(early_stopping),
+            'budget': {'run': [report['budget']['run'] for report in reports], 'degradations': dict(degradations)},
+            'batch': dict(batch) if batch else None,
+            'shards': [{'n_debates': report['n_debates'], 'n_failed': report['n_failed'], 'elapsed_seconds': report['elapsed_seconds'],
+                        'debates_per_hour': report['debates_per_hour']} for report in reports]}
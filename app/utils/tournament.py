@@ -0,0 +1,175 @@
+from utils.debate import Debate
+from utils.checkpoint import Checkpoint
+from utils.funcs import run_sync
+from utils.metrics import summarize_calls
+
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+def read_topic_configs(path: str):
+    """Lazily yield topic configs ({'topic', 'n_talking_points', 'n_rounds'}) from a JSONL file."""
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+async def _iterate(topic_configs):
+    # accept both plain and async iterables of topic configs
+    if hasattr(topic_configs, '__aiter__'):
+        async for topic_config in topic_configs:
+            yield topic_config
+    else:
+        for topic_config in topic_configs:
+            yield topic_config
+
+class Tournament:
+
+    def __init__(self, max_concurrency = 4, output_path = None, parallel_talking_points = False, transcript_dir = None, checkpoint_dir = None, **debate_kwargs) -> None:
+
+        self.max_concurrency = max_concurrency
+        self.output_path = output_path
+        # one compressed JSONL transcript per debate, named after the topic config's id (or its position)
+        self.transcript_dir = transcript_dir
+        if transcript_dir is not None:
+            os.makedirs(transcript_dir, exist_ok = True)
+        # one checkpoint per debate, named the same way; a debate whose checkpoint exists resumes from it (e.g. a redelivered queue job)
+        self.checkpoint_dir = checkpoint_dir
+        if checkpoint_dir is not None:
+            os.makedirs(checkpoint_dir, exist_ok = True)
+        self.n_started = 0
+        self.parallel_talking_points = parallel_talking_points
+        # concurrent debates narrating on stdout would interleave, consumers subscribe to a shared `events` bus instead
+        self.debate_kwargs = {'verbose': False, **debate_kwargs}
+
+        self.results = []
+        self.n_failed = 0
+        self.tokens = Counter()
+        self.costs = Counter()
+        self.prompt_cache = {}
+        self.early_stopping = Counter()
+        self.budget_degradations = Counter()
+        self.calls = []
+
+    async def run_debate_async(self, topic_config: dict):
+
+        start = time.perf_counter()
+
+        self.n_started += 1
+        name = topic_config.get('id', self.n_started)
+        transcript_path = None
+        if self.transcript_dir is not None:
+            transcript_path = os.path.join(self.transcript_dir, f'{name}.jsonl.gz')
+        checkpoint = None
+        if self.checkpoint_dir is not None:
+            checkpoint_path = os.path.join(self.checkpoint_dir, f'{name}.ckpt.json.gz')
+            checkpoint = Checkpoint.load(checkpoint_path) if Checkpoint.exists(checkpoint_path) else Checkpoint(checkpoint_path)
+
+        debate = Debate(topic = topic_config['topic'],
+                        n_talking_points = topic_config.get('n_talking_points', 2),
+                        n_rounds = topic_config.get('n_rounds', 1),
+                        setup = False,
+                        transcript_path = transcript_path,
+                        checkpoint = checkpoint,
+                        **self.debate_kwargs)
+        try:
+            await debate.setup_async()
+            await debate.debate_async(parallel = self.parallel_talking_points)
+        finally:
+            # debate_async closes it too, this covers a failed setup
+            debate.transcript.close()
+
+        self.calls.extend(debate.calls())
+
+        result = debate.results()
+        result['id'] = topic_config.get('id')
+        result['elapsed_seconds'] = time.perf_counter() - start
+        return result
+
+    def write_result(self, result: dict):
+
+        self.results.append(result)
+        if self.output_path is not None:
+            with open(self.output_path, 'a') as file:
+                file.write(json.dumps(result) + '\n')
+
+    async def worker(self, queue: asyncio.Queue):
+
+        while True:
+            topic_config = await queue.get()
+            if topic_config is None:
+                return
+
+            try:
+                result = await self.run_debate_async(topic_config)
+                self.tally(result)
+            except Exception as e:
+                result = self.failed(topic_config, e)
+
+            self.write_result(result)
+
+    def tally(self, result: dict):
+
+        self.tokens.update(result['total_tokens'])
+        self.costs.update(result['total_costs'])
+        for role, usage in result['prompt_cache'].items():
+            self.prompt_cache.setdefault(role, Counter()).update({'prompt_tokens': usage['prompt_tokens'], 'cached_prompt_tokens': usage['cached_prompt_tokens']})
+        if 'early_stopping' in result:
+            self.early_stopping.update({key: result['early_stopping'][key] for key in ['rounds_run', 'rounds_skipped', 'tokens_saved_estimate']})
+        if 'budget' in result:
+            self.budget_degradations.update(degradation['action'] for degradation in result['budget']['degradations'])
+
+    def failed(self, topic_config: dict, error: Exception):
+        self.n_failed += 1
+        return {'id': topic_config.get('id'), 'topic': topic_config.get('topic'), 'error': repr(error)}
+
+    async def run_async(self, topic_configs):
+
+        self.start = time.perf_counter()
+
+        # a bounded queue keeps the topic stream lazy: at most max_concurrency debates in flight plus as many waiting
+        queue = asyncio.Queue(maxsize = self.max_concurrency)
+        workers = [asyncio.create_task(self.worker(queue)) for _ in range(self.max_concurrency)]
+
+        async for topic_config in _iterate(topic_configs):
+            await queue.put(topic_config)
+        for _ in workers:
+            await queue.put(None)
+
+        await asyncio.gather(*workers)
+
+        self.elapsed = time.perf_counter() - self.start
+        return self.report()
+
+    def run(self, topic_configs):
+        return run_sync(self.run_async(topic_configs))
+
+    def report(self):
+
+        elapsed = getattr(self, 'elapsed', None) or time.perf_counter() - self.start
+        n_completed = len(self.results) - self.n_failed
+
+        return {'n_debates': len(self.results),
+                'n_completed': n_completed,
+                'n_failed': self.n_failed,
+                'elapsed_seconds': elapsed,
+                'debates_per_hour': n_completed / elapsed * 3600 if elapsed else 0.0,
+                'tokens_per_sec': self.tokens.get('total_tokens', 0) / elapsed if elapsed else 0.0,
+                'total_tokens': dict(self.tokens),
+                'total_costs': dict(self.costs),
+                'prompt_cache': {role: {**usage, 'hit_ratio': usage['cached_prompt_tokens'] / usage['prompt_tokens'] if usage['prompt_tokens'] else 0.0}
+                                 for role, usage in self.prompt_cache.items()},
+                'latency_by_role': summarize_calls(self.calls, by='role'),
+                'latency_by_phase': summarize_calls(self.calls, by='phase'),
+                'early_stopping': dict(self.early_stopping),
+                'budget': self.budget_report(),
+                'batch': self.debate_kwargs['batch'].stats() if self.debate_kwargs.get('batch') is not None else None}
+
+    def budget_report(self):
+        # the run's shared budget (see Debate's run_budget) is charged live, so this can be polled while the run is in flight
+        run_budget = self.debate_kwargs.get('run_budget')
+        return {'run': run_budget.stats() if run_budget is not None else None,
+                'degradations': dict(self.budget_degradations)}
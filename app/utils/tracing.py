@@ -0,0 +1,102 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+import weakref
+from contextlib import contextmanager
+
+class Tracer:
+    """
+    Records spans in Chrome trace event format, to open a debate's timeline in chrome://tracing or https://ui.perfetto.dev.
+
+    Every debate is a process of its own (named after its topic) and every asyncio task a thread within it, so spans opened
+    one after the other nest and concurrent talking points and debates get lanes side by side. Timestamps are wall clock
+    microseconds, traces of several processes (e.g. the shards of a tournament) line up when merged, see merge_traces.
+    """
+
+    def __init__(self) -> None:
+        self.events = []
+        self.origin = time.perf_counter()
+        self.origin_wall = time.time()
+        self.pids = {}
+        self.lanes = weakref.WeakKeyDictionary()
+        # a counter rather than len(self.lanes): finished tasks drop out of the weak dict, their lane ids must not come back
+        self.lane_ids = itertools.count(1)
+        self.named_lanes = set()
+
+    def timestamp(self, perf_counter: float):
+        # perf_counter readings (what Agent call records are timed with) as microseconds since the epoch
+        return (self.origin_wall + perf_counter - self.origin) * 1e6
+
+    def pid(self, process = None, name = None):
+        """Trace pid of a process key (a debate id), announced under `name` (default: the key) the first time it is seen."""
+        if process not in self.pids:
+            self.pids[process] = len(self.pids) + 1
+            self.events.append({'ph': 'M', 'name': 'process_name', 'pid': self.pids[process], 'tid': 0, 'args': {'name': name or str(process)}})
+        return self.pids[process]
+
+    def tid(self, pid: int, lane = None):
+        """Lane of the running asyncio task (0 outside of one); `lane` names it unless a span opened on it earlier already did."""
+
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        tid = 0
+        if task is not None:
+            if task not in self.lanes:
+                self.lanes[task] = next(self.lane_ids)
+            tid = self.lanes[task]
+
+        if lane is not None and (pid, tid) not in self.named_lanes:
+            self.named_lanes.add((pid, tid))
+            self.events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid, 'tid': tid, 'args': {'name': lane}})
+        return tid
+
+    def complete(self, name: str, start: float, end: float, cat = 'debate', process = None, args = None):
+        """Add a span that has already ended, from perf_counter readings."""
+        pid = self.pid(process)
+        # both ends converted the same way, so spans sharing an end (a call and its last part) nest exactly
+        ts = self.timestamp(start)
+        self.events.append({'ph': 'X', 'name': name, 'cat': cat, 'ts': ts, 'dur': self.timestamp(end) - ts,
+                            'pid': pid, 'tid': self.tid(pid), 'args': args or {}})
+
+    @contextmanager
+    def span(self, name: str, cat = 'debate', process = None, lane = None, **args):
+        """Time the block as a span; yields its args dict, which the block can add attributes to. Exceptions are recorded, not swallowed."""
+
+        self.tid(self.pid(process), lane)
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = type(e).__name__
+            raise
+        finally:
+            self.complete(name, start, time.perf_counter(), cat=cat, process=process, args=args)
+
+    def instant(self, name: str, cat = 'debate', process = None, **args):
+        pid = self.pid(process)
+        self.events.append({'ph': 'i', 's': 't', 'name': name, 'cat': cat, 'ts': self.timestamp(time.perf_counter()),
+                            'pid': pid, 'tid': self.tid(pid), 'args': args})
+
+    def save(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, file)
+
+def merge_traces(paths: "list[str]", output_path: str):
+    """Merge trace files of separate processes into one; pids are renumbered so their debates stay apart."""
+
+    events = []
+    offset = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, 'r') as file:
+            trace_events = json.load(file)['traceEvents']
+        events.extend({**event, 'pid': event['pid'] + offset} for event in trace_events)
+        offset += max((event['pid'] for event in trace_events), default = 0)
+
+    with open(output_path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
@@ -0,0 +1,84 @@
+import gzip
+import json
+
+from utils.turns import Turn
+
+class Transcript:
+    """
+    Append-only record of a debate's turns: one utils.turns.Turn per turn with its phase, talking point, round, speaker, text, tokens and timings.
+    It doubles as the debate's turn store, agents' memories hold views of these turns rather than copies of their text.
+
+    With a path every record is written to a JSONL file (gzip compressed if the path ends in .gz) as soon as the turn
+    completes, so consumers can follow a debate while it runs; only the records of talking points still in progress
+    are kept in memory. Without a path all records stay in memory. Transcript text is rendered from the records on demand.
+    """
+
+    SPEAKER_LABELS = {'debater_1': 'Debater #1', 'debater_2': 'Debater #2'}
+
+    def __init__(self, path = None, debate_id = None) -> None:
+        self.path = path
+        self.debate_id = debate_id
+        self.records = []
+        # talking point -> its debater turns so far, for the moderator's transcript
+        self.in_progress = {}
+        self.file = None
+        if path is not None:
+            self.file = gzip.open(path, 'wt') if path.endswith('.gz') else open(path, 'w')
+
+    def add(self, agent, text: str, phase: str, talking_point = None, round = None):
+        # timings and token counts come from the call the agent just completed
+        call = agent.calls_raw[-1] if agent.calls_raw else {}
+        turn = Turn(agent.name, text, phase=phase, talking_point=talking_point, round=round, debate_id=self.debate_id,
+                    prompt_tokens=call.get('prompt_tokens'), completion_tokens=call.get('completion_tokens'), started_at=call.get('started_at'),
+                    latency_s=call.get('latency_s'), ttft_s=call.get('ttft_s'), cached=call.get('cached'))
+
+        if round is not None:
+            self.in_progress.setdefault(talking_point, []).append(turn)
+
+        if self.file is None:
+            self.records.append(turn)
+        else:
+            self.file.write(json.dumps(turn.to_dict()) + '\n')
+            self.file.flush()
+        return turn
+
+    def finish_talking_point(self, talking_point):
+        self.in_progress.pop(talking_point, None)
+
+    def __iter__(self):
+
+        if self.file is None:
+            yield from self.records
+            return
+
+        opener = gzip.open if self.path.endswith('.gz') else open
+        with opener(self.path, 'rt') as file:
+            try:
+                for line in file:
+                    yield Turn.from_dict(json.loads(line))
+            except EOFError:
+                # a gzip stream still being written has no end marker yet, everything flushed so far was read
+                pass
+
+    def round_turns(self, talking_point):
+        if talking_point in self.in_progress:
+            return self.in_progress[talking_point]
+        return [turn for turn in self if turn.talking_point == talking_point and turn.round is not None]
+
+    def render_rounds(self, talking_point, max_round = None):
+        """The talking point's debate as the moderator reads it: a header per round, then each debater's answer (up to max_round)."""
+
+        parts = []
+        current_round = None
+        for turn in self.round_turns(talking_point):
+            if max_round is not None and turn.round > max_round:
+                continue
+            if turn.round != current_round:
+                current_round = turn.round
+                parts.append("\n" + f'===== Round {current_round} =====' + "\n")
+            parts.append("\n\n" + self.SPEAKER_LABELS.get(turn.speaker, turn.speaker) + ":\n" + turn.text)
+        return ''.join(parts)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
@@ -0,0 +1,52 @@
+class Turn:
+    """One completed turn of a debate. Its text is stored once, however many agents keep it in memory."""
+
+    __slots__ = ('debate_id', 'phase', 'talking_point', 'round', 'speaker', 'text',
+                 'prompt_tokens', 'completion_tokens', 'started_at', 'latency_s', 'ttft_s', 'cached')
+
+    def __init__(self, speaker: str, text: str, phase = None, talking_point = None, round = None, debate_id = None, prompt_tokens = None,
+                 completion_tokens = None, started_at = None, latency_s = None, ttft_s = None, cached = None) -> None:
+        self.debate_id = debate_id
+        self.phase = phase
+        self.talking_point = talking_point
+        self.round = round
+        self.speaker = speaker
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.started_at = started_at
+        self.latency_s = latency_s
+        self.ttft_s = ttft_s
+        self.cached = cached
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, record: dict):
+        return cls(**record)
+
+class MemoryEntry:
+    """
+    One message of an agent's memory: a role and either its own text or a view of a shared Turn between a prefix and a suffix.
+
+    Entries are never changed in place, so forks and agents can share them; the message dict is only built when a request is sent.
+    """
+
+    __slots__ = ('role', 'text', 'turn', 'prefix', 'suffix')
+
+    def __init__(self, role: str, text = None, turn: Turn = None, prefix = '', suffix = '') -> None:
+        self.role = role
+        self.text = text
+        self.turn = turn
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @property
+    def content(self):
+        if self.turn is None:
+            return self.text
+        return self.prefix + self.turn.text + self.suffix
+
+    def to_message(self):
+        return {'role': self.role, 'content': self.content}